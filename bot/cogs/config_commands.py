@@ -0,0 +1,101 @@
+import logging
+import discord
+from discord.ext import commands
+from typing import Optional
+from utils.config.guild_config import MAX_PREFIX_LEN
+
+logger = logging.getLogger("CONFIG")
+PROTECTED_COGS = ["Config"]
+
+class Config(commands.Cog):
+    """Server settings: command prefix, enabled command groups, automatic VirusTotal scans and their thresholds. Changing them requires the Manage Server permission."""
+    def __init__(self, bot):
+        self.bot = bot
+        self.store = bot.guild_config
+
+    async def cog_check(self, ctx):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        if ctx.command.name == "config":
+            return True
+        if not ctx.author.guild_permissions.manage_guild:
+            await ctx.send("You need the Manage Server permission to change the settings folk.")
+            return False
+        return True
+
+
+    @commands.command(help="Shows the settings of this server.")
+    async def config(self, ctx):
+        config = self.store.get(ctx.guild.id)
+        channels = ", ".join(f"<#{channel}>" for channel in sorted(config.autoscan_channels)) or "None"
+        disabled = ", ".join(sorted(config.disabled_cogs)) or "None"
+
+        embed = discord.Embed(
+            title=f"Settings for {ctx.guild.name} ⚙️",
+            description=(
+                f"◈ **Prefix**: `{config.prefix}`\n\n"
+                f"◈ **Disabled groups**: {disabled}\n\n"
+                f"◈ **Auto scan channels**: {channels}\n\n"
+                f"◈ **VirusTotal alert thresholds**: more than {config.vt_malicious} malicious or {config.vt_suspicious} suspicious"
+            ),
+            colour=discord.Colour.light_grey()
+        )
+        embed.set_footer(text="Handle with care 🔧")
+        embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/klinklang.gif")
+        await ctx.send(embed=embed)
+
+
+    @commands.command(help=f"Changes the command prefix of this server (max {MAX_PREFIX_LEN} characters).")
+    async def prefix(self, ctx, new_prefix: str):
+        if not new_prefix or len(new_prefix) > MAX_PREFIX_LEN or any(c.isspace() for c in new_prefix):
+            return await ctx.send(f"Prefix must be 1-{MAX_PREFIX_LEN} characters without whitespaces.")
+
+        self.store.update(ctx.guild.id, prefix=new_prefix)
+        logger.info(f" Prefix changed to {new_prefix}\nUser: {ctx.author.name}\nServer: {ctx.guild.name}\n")
+        await ctx.send(f"Prefix changed to `{new_prefix}`")
+
+
+    @commands.command(help="Enables or disables a group of commands in this server.\nUsage: `cog <enable|disable> <group>`")
+    async def cog(self, ctx, action: str, name: str):
+        cog = next((c for c in self.bot.cogs if c.lower() == name.lower()), None)
+        if cog is None:
+            return await ctx.send(f"Unknown group. Available groups: {', '.join(sorted(self.bot.cogs))}")
+        if cog in PROTECTED_COGS:
+            return await ctx.send(f"`{cog}` can't be disabled.")
+
+        disabled = set(self.store.get(ctx.guild.id).disabled_cogs)
+        match action.lower():
+            case "enable": disabled.discard(cog)
+            case "disable": disabled.add(cog)
+            case _: return await ctx.send("Action must be `enable` or `disable`.")
+
+        self.store.update(ctx.guild.id, disabled_cogs=disabled)
+        logger.info(f" {cog} {action}d\nUser: {ctx.author.name}\nServer: {ctx.guild.name}\n")
+        await ctx.send(f"`{cog}` commands {action.lower()}d.")
+
+
+    @commands.command(help="Adds or removes a channel (the current one by default) from the automatic VirusTotal scan of posted URLs and IPs.\nUsage: `autoscan <add|remove> [#channel]`")
+    async def autoscan(self, ctx, action: str, channel: Optional[discord.TextChannel] = None):
+        channel = channel or ctx.channel
+        channels = set(self.store.get(ctx.guild.id).autoscan_channels)
+        match action.lower():
+            case "add": channels.add(channel.id)
+            case "remove": channels.discard(channel.id)
+            case _: return await ctx.send("Action must be `add` or `remove`.")
+
+        self.store.update(ctx.guild.id, autoscan_channels=channels)
+        logger.info(f" Auto scan {action} {channel.name}\nUser: {ctx.author.name}\nServer: {ctx.guild.name}\n")
+        await ctx.send(f"Auto scan {'enabled' if channel.id in channels else 'disabled'} in {channel.mention}.")
+
+
+    @commands.command(help="Sets how many malicious and suspicious detections a VirusTotal report needs to exceed to be flagged. Default: 0 2")
+    async def vt_threshold(self, ctx, malicious: int, suspicious: int):
+        if malicious < 0 or suspicious < 0:
+            return await ctx.send("Thresholds can't be negative.")
+
+        self.store.update(ctx.guild.id, vt_malicious=malicious, vt_suspicious=suspicious)
+        await ctx.send(f"Reports are now flagged with more than {malicious} malicious or {suspicious} suspicious detections.")
+
+
+async def setup(bot):
+    await bot.add_cog(Config(bot))
@@ -1,15 +1,142 @@
+import asyncio
+import io
+import json
+import os
+import time
 import logging
 import discord
 from discord.ext import commands
+from typing import Optional
 from utils.dns import dnslookup
+from utils.dns.bulk import parse_hosts, bulk_resolve, rows_to_csv, rows_to_json, normalize_host, MAX_HOSTS, MAX_FILE_SIZE
+from utils.embeds import paginator
+from utils.dns import audit
+from utils.dns.subbrute import SubBrute, parse_words, MAX_WORDS
 from utils.vt.ip_scan import valid_ip
 
 logger = logging.getLogger("DNS")
+DNS_UPSTREAMS = [spec for spec in os.getenv("DNS_UPSTREAMS", "").split(",") if spec.strip()]  # e.g. tls://1.1.1.1#cloudflare-dns.com,https://dns.google/dns-query
+DNS_TIMEOUT = float(os.getenv("DNS_TIMEOUT", "5"))
+EDIT_INTERVAL = 1.5  # Seconds between edits of a streamed reply, keeps us under Discord's rate limits
+SUBBRUTE_WORDLIST = os.getenv("SUBBRUTE_WORDLIST", "bot/data/subdomains.txt")
+SUBBRUTE_STATE_DIR = os.getenv("SUBBRUTE_STATE_DIR", "bot/data/subbrute")  # Progress of unfinished runs, to resume them
+SUBBRUTE_MAX_JOBS = int(os.getenv("SUBBRUTE_MAX_JOBS", "2"))
+SUBBRUTE_PROGRESS_INTERVAL = 5
+
+
+def dns_embed(title: str, footer: str = "Dumb Name Service") -> discord.Embed:
+    embed = discord.Embed(
+        title=title,
+        color=discord.Color.dark_green()
+    )
+    embed.set_footer(text=footer)
+    embed.set_author(name="The Resolver 🧙‍♂️", icon_url="https://play.pokemonshowdown.com/sprites/trainers/bryony.png")
+    embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/shiftry.gif")
+    return embed
+
+
+def records_embeds(template: discord.Embed, sections: list[dict[str, list[str]]]) -> list[discord.Embed]:
+    """Packs DNS records, one field per record type, into as few embeds as Discord's limits allow."""
+    fields = [
+        field
+        for section in sections
+        for type, records in section.items()
+        for field in paginator.split_field(type, "\n".join(records), code=True)
+    ]
+    return paginator.pack(fields, template)
+
+
+def bulk_progress(done: int, total: int, counts: dict[str, int], start: float) -> discord.Embed:
+    summary = " · ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "Starting..."
+    embed = dns_embed(f"Bulk Resolution {'finished ✅' if done == total else 'in progress ⏳'}", f"Dumb Name Service · {time.monotonic() - start:.1f}s")
+    embed.description = f"◈ **Resolved**: {done}/{total}\n\n◈ **Results**: {summary}"
+    return embed
+
+
+def subbrute_progress(job: SubBrute, state: str) -> discord.Embed:
+    elapsed = time.monotonic() - job.started
+    wildcard = f"yes, {job.suppressed} hits suppressed" if job.wildcard else "no"
+    embed = dns_embed(f"Subdomain Brute Force of {job.domain} {state}", f"Dumb Name Service · {elapsed:.0f}s")
+    embed.description = (
+        f"◈ **Tried**: {job.done}/{job.total}" + (" (resumed)" if job.resumed else "") + "\n\n"
+        f"◈ **Found**: {len(job.found)}\n\n"
+        f"◈ **Wildcard DNS**: {wildcard}\n\n"
+        f"◈ **Failed queries**: {job.errors}"
+    )
+    return embed
+
+
+def brute_key(ctx, domain: str) -> tuple[int, str]:
+    """Key of a brute force run in `DNS.brute_jobs`: runs are per server (per channel in DMs)."""
+    return ctx.guild.id if ctx.guild else ctx.channel.id, domain
+
+
+def reverse_embeds(title: str, results: list[dict[str, list[str]]], total: int) -> list[discord.Embed]:
+    template = dns_embed(title, f"Dumb Name Service · {len(results)}/{total} PTR names resolved")
+    if len(results) < total:
+        template.description = f"Resolving PTR names... ({len(results)}/{total}) ⏳"
+    return records_embeds(template, results)
+
+
+def spf_lines(node: dict, depth: int = 0) -> list[str]:
+    line = f"{'  ' * depth}{'└ ' if depth else ''}{node['domain']}"
+    if node["error"]:
+        line += f" ({node['error']})"
+    return [line] + [child for include in node["includes"] for child in spf_lines(include, depth + 1)]
+
+
+def audit_embeds(report: dict) -> list[discord.Embed]:
+    template = dns_embed(f"DNS Audit of {report['domain']}", f"Dumb Name Service · {report['elapsed']}s")
+    icons = {"allowed": "🔓", "refused": "🔒", "unreachable": "⚠️"}
+    axfr = "\n".join(
+        f"{icons[ns['status']]} {ns['ns']}: {ns['status']}" + (f" ({ns['records']} records)" if ns["status"] == "allowed" else "")
+        for ns in report["axfr"]
+    ) or "No NS records found"
+
+    dnssec = report["dnssec"]
+    dnssec_icons = {audit.SECURE: "✅", audit.INSECURE: "➖", audit.BOGUS: "💢", audit.UNVALIDATED: "❔"}
+    dnssec_text = f"{dnssec_icons[dnssec['status']]} {dnssec['status']}: {dnssec['reason']}"
+    if dnssec["chain"]:
+        dnssec_text += f"\nChain: {' → '.join(dnssec['chain'])}"
+
+    spf = report["spf"]
+    lookups = f"{spf['lookups']}/{audit.SPF_LOOKUP_LIMIT} lookups" + (" ⚠️ over the limit" if spf["lookups"] > audit.SPF_LOOKUP_LIMIT else "")
+
+    dmarc = report["dmarc"]
+    dmarc_text = " · ".join(f"{tag}={dmarc[tag]}" for tag in ("p", "sp", "pct", "rua") if tag in dmarc) if dmarc else "❌ No DMARC record"
+    dkim_text = ", ".join(f"{selector} ({tags.get('k', 'rsa')})" for selector, tags in report["dkim"].items()) or "None found among the common selectors"
+
+    fields = [
+        *paginator.split_field("Zone transfer", axfr),
+        *paginator.split_field("DNSSEC", dnssec_text),
+        *paginator.split_field(f"SPF ({lookups})", "\n".join(spf_lines(spf)), code=True),
+        *(paginator.split_field("SPF record", spf["record"], code=True) if spf["record"] else []),
+        *paginator.split_field("DMARC", dmarc_text),
+        *paginator.split_field("DKIM", dkim_text),
+    ]
+    return paginator.pack(fields, template)
+
 
 class DNS(commands.Cog):
     """Commands to perform queries related to DNS"""
     def __init__(self, bot):
         self.bot = bot
+        # (server or DM channel ID, domain) -> (job, task, ID of the user who started it), None while it's starting
+        self.brute_jobs: dict[tuple[int, str], Optional[tuple[SubBrute, asyncio.Task, int]]] = {}
+
+    async def cog_load(self):
+        try:
+            dnslookup.configure(DNS_UPSTREAMS, DNS_TIMEOUT)
+        except ValueError as e:
+            logger.error(f" Invalid DNS_UPSTREAMS, using the system resolver: {e}")
+
+    async def cog_unload(self):
+        # Stopped runs save their progress, they can be resumed after a restart
+        running = [entry for entry in self.brute_jobs.values() if entry is not None]
+        for job, _, _ in running:
+            job.stop()
+        await asyncio.gather(*(task for _, task, _ in running), return_exceptions=True)
+        await dnslookup.close()
 
     @commands.command(help="Performs a DNS lookup for the given domain.")
     async def dnslookup(self, ctx, domain: str):
@@ -17,52 +144,18 @@ class DNS(commands.Cog):
         await ctx.message.add_reaction("👓")
 
         try:
-            results = dnslookup.lookup(domain)
+            results, stats = await dnslookup.lookup_detailed(domain)
             if not results:
                 return await ctx.send("No DNS records found. Make sure the domain is valid.")
 
 
-            embed = discord.Embed(
-                title=f"DNS Lookup Results for {domain}",
-                color=discord.Color.dark_green()
-            )
-
-
-            chars = 0
-            embeds = [embed]
-            for type, records in results.items():
-                field_value = "\n".join(records)
-                
-
-
-                if len(field_value) > 1024:
-                    parts = [field_value[i:i+1000] for i in range(0, len(field_value), 1000)] #Split into different parts if the record is too long to fit in a single field
-                    for p in parts:
-                        embed.add_field(
-                            name=f"{type}",
-                            value=f"```\n{p}\n```",
-                            inline=False
-                        )
-                else:
-                    #If the record is short enough, add it to the field.
-                    # Also check if adding this field would exceed the character limit or field count
-                    if chars + len(field_value) > 5000 or len(embed.fields) >= 20:
-                        embed = discord.Embed(color=discord.Color.blue())
-                        embeds.append(embed)
-                        chars = 0
-                    embed.add_field(
-                        name=type,
-                        value=f"```\n{field_value}\n```",
-                        inline=False
-                    )
-                    chars += len(field_value)
-
-
-            for embed in embeds:
-                embed.set_footer(text="Dumb Name Service")
-                embed.set_author(name="The Resolver 🧙‍♂️", icon_url="https://play.pokemonshowdown.com/sprites/trainers/bryony.png")
-                embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/shiftry.gif")
-                await ctx.send(embed=embed)
+            # Report how long the lookup took and which record types couldn't be resolved
+            elapsed = max(time for _, time in stats.values())
+            failed = [f"{type} {status}" for type, (status, _) in stats.items() if status in (dnslookup.TIMEOUT_STATUS, dnslookup.ERROR)]
+            footer = f"Dumb Name Service · {elapsed * 1000:.0f} ms" + (f" · Partial: {', '.join(failed)}" if failed else "")
+
+            embeds = records_embeds(dns_embed(f"DNS Lookup Results for {domain}", footer), [results])
+            await paginator.send(ctx, embeds, ctx.author.id)
 
         except Exception as e:
             logger.error(f"DNS lookup error for `{domain}`: {e}")
@@ -77,58 +170,222 @@ class DNS(commands.Cog):
         try:
             if not await valid_ip(ip):
                 return await ctx.send(f"Invalid or private IP address. Please provide a valid public IP address.")
-            results = dnslookup.reverse_lookup(ip)
-            if not results or len(results[0]) == 0 or not isinstance(results, list):
+            names = await dnslookup.ptr_names(ip)
+            if not names:
                 return await ctx.send("No DNS records found for this IP.")
 
 
-            embed = discord.Embed(
-                title=f"Reverse DNS Lookup Results for {ip}",
-                color=discord.Color.dark_green()
-            )
-
-
-            chars = 0
-            embeds = [embed]
-            for record in results:
-                for type, records in record.items():
-                    field_value = "\n".join(records)
-                    
-
-
-                    if len(field_value) > 1024:
-                        parts = [field_value[i:i+1000] for i in range(0, len(field_value), 1000)] #Split into different parts if the record is too long to fit in a single field
-                        for p in parts:
-                            embed.add_field(
-                                name=f"{type}",
-                                value=f"```\n{p}\n```",
-                                inline=False
-                            )
-                    else:
-                        #If the record is short enough, add it to the field.
-                        # Also check if adding this field would exceed the character limit or field count
-                        if chars + len(field_value) > 5000 or len(embed.fields) >= 20:
-                            embed = discord.Embed(color=discord.Color.blue())
-                            embeds.append(embed)
-                            chars = 0
-                        embed.add_field(
-                            name=type,
-                            value=f"```\n{field_value}\n```",
-                            inline=False
-                        )
-                        chars += len(field_value)
-
-
-            for embed in embeds:
-                embed.set_footer(text="Dumb Name Service")
-                embed.set_author(name="The Resolver 🧙‍♂️", icon_url="https://play.pokemonshowdown.com/sprites/trainers/bryony.png")
-                embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/shiftry.gif")
-                await ctx.send(embed=embed)
+            # Forward lookups run concurrently, the reply is edited as each PTR name completes
+            title = f"Reverse DNS Lookup Results for {ip}"
+            results = []
+            message = await ctx.send(embed=reverse_embeds(title, results, len(names))[0])
+            last_edit = time.monotonic()
+
+            async for name, records in dnslookup.forward_lookups(names):
+                results.append({"PTR": [name], **records})
+                if time.monotonic() - last_edit >= EDIT_INTERVAL:
+                    await message.edit(embed=reverse_embeds(title, results, len(names))[0])
+                    last_edit = time.monotonic()
+
+            await paginator.edit(message, reverse_embeds(title, results, len(names)), ctx.author.id)
 
         except Exception as e:
             logger.error(f"Reverse DNS lookup error for `{ip}`: {e}")
             await ctx.send("An error occurred while performing the Reverse DNS lookup")
 
+    @commands.command(help=f"Resolves the A, AAAA and CNAME records of many hosts and returns them as a CSV (or JSON) file. Paste the hosts after the command or attach a .txt/.csv wordlist (max {MAX_HOSTS} hosts).\nUsage: `dnsbulk [csv|json] [hosts...]`")
+    async def dnsbulk(self, ctx, *, hosts: str = ""):
+        logger.info(f" Bulk lookup\nUser: {ctx.author}\nServer: {ctx.guild}")
+        await ctx.message.add_reaction("👓")
+
+        format, _, rest = hosts.partition(" ")
+        if format.lower() in ("csv", "json"):
+            hosts = rest
+        else:
+            format = "csv"
+
+        text = hosts
+        for attachment in ctx.message.attachments:
+            if not attachment.filename.lower().endswith((".txt", ".csv")):
+                continue
+            if attachment.size > MAX_FILE_SIZE:
+                return await ctx.send(f"The attached list is too big (max {MAX_FILE_SIZE // 1024} KB).")
+            text += "\n" + (await attachment.read()).decode(errors="ignore")
+
+        targets, invalid = parse_hosts(text)
+        if not targets:
+            return await ctx.send("No valid hostnames found. Paste them after the command or attach a .txt/.csv file.")
+        if len(targets) > MAX_HOSTS:
+            return await ctx.send(f"Too many hosts ({len(targets)}). The limit is {MAX_HOSTS} per run.")
+
+        try:
+            start = time.monotonic()
+            counts = {}
+            rows = []
+            status = await ctx.send(embed=bulk_progress(0, len(targets), counts, start))
+            last_edit = time.monotonic()
+
+            async for row in bulk_resolve(targets):
+                rows.append(row)
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+                if time.monotonic() - last_edit >= EDIT_INTERVAL:
+                    await status.edit(embed=bulk_progress(len(rows), len(targets), counts, start))
+                    last_edit = time.monotonic()
+
+            # Back to the order of the list, rows come in as they resolve
+            order = {host: i for i, host in enumerate(targets)}
+            rows.sort(key=lambda row: order[row["host"]])
+            file = rows_to_json(rows) if format.lower() == "json" else rows_to_csv(rows)
+
+            embed = bulk_progress(len(rows), len(targets), counts, start)
+            if invalid:
+                embed.description += f"\n\n◈ **Ignored**: {len(invalid)} invalid entries"
+            await status.edit(embed=embed, attachments=[discord.File(file, filename=f"dnsbulk.{format.lower()}")])
+            logger.info(f" Bulk lookup of {len(rows)} hosts finished in {time.monotonic() - start:.1f}s\nUser: {ctx.author}")
+
+        except Exception as e:
+            logger.error(f"Bulk DNS lookup error: {e}")
+            await ctx.send("An error occurred while performing the bulk DNS lookup")
+
+
+    @commands.command(help="Brute forces the subdomains of a domain in the background, with the built-in wordlist or an attached .txt one. Wildcard DNS is detected and its hits dropped. Stopped runs resume where they left off when started again with the same wordlist.\nUsage: `subbrute <domain>`")
+    async def subbrute(self, ctx, domain: str):
+        logger.info(f" Subdomain brute force of {domain}\nUser: {ctx.author}\nServer: {ctx.guild}")
+        await ctx.message.add_reaction("👓")
+
+        domain = normalize_host(domain)
+        if domain is None:
+            return await ctx.send("Invalid domain.")
+        key = brute_key(ctx, domain)
+        if key in self.brute_jobs:
+            return await ctx.send(f"`{domain}` is already being brute forced. Use `subbrute_stop {domain}` to stop it.")
+        if len(self.brute_jobs) >= SUBBRUTE_MAX_JOBS:
+            return await ctx.send(f"There are already {len(self.brute_jobs)} brute force runs going, try again later folk.")
+
+        # The slot is taken before anything is awaited, so commands sent at the same time can't go over the limit
+        self.brute_jobs[key] = None
+        try:
+            attachment = next((a for a in ctx.message.attachments if a.filename.lower().endswith(".txt")), None)
+            if attachment is not None:
+                if attachment.size > MAX_FILE_SIZE:
+                    return await ctx.send(f"The attached wordlist is too big (max {MAX_FILE_SIZE // 1024} KB).")
+                words = parse_words((await attachment.read()).decode(errors="ignore"))
+            else:
+                with open(SUBBRUTE_WORDLIST) as file:
+                    words = parse_words(file.read())
+            if not words:
+                return await ctx.send("The wordlist is empty.")
+            if len(words) > MAX_WORDS:
+                return await ctx.send(f"The wordlist is too long ({len(words)} words, max {MAX_WORDS}).")
+
+            job = SubBrute(domain, words, os.path.join(SUBBRUTE_STATE_DIR, str(key[0]), f"{domain}.json"))
+            status = await ctx.send(embed=subbrute_progress(job, "started ⏳"))
+            task = asyncio.create_task(self._run_subbrute(ctx, job, status, key))
+            self.brute_jobs[key] = (job, task, ctx.author.id)
+
+        finally:
+            if self.brute_jobs.get(key) is None:
+                self.brute_jobs.pop(key, None)
+
+
+    @commands.command(help="Stops a subdomain brute force run of this server, its progress is saved to resume it later. Only who started it or members with the Manage Server permission can stop it.\nUsage: `subbrute_stop <domain>`")
+    async def subbrute_stop(self, ctx, domain: str):
+        entry = self.brute_jobs.get(brute_key(ctx, normalize_host(domain) or domain))
+        if entry is None:
+            return await ctx.send("That domain isn't being brute forced here.")
+        job, _, author_id = entry
+        if ctx.author.id != author_id and not (ctx.guild and ctx.author.guild_permissions.manage_guild):
+            return await ctx.send("Only who started the brute force or someone with the `Manage Server` permission can stop it.")
+        job.stop()
+        await ctx.send(f"Stopping the brute force of `{job.domain}`. Run `subbrute {job.domain}` again to resume it.")
+
+
+    async def _run_subbrute(self, ctx, job: SubBrute, status: discord.Message, key: tuple[int, str]):
+        run = asyncio.create_task(job.run())
+        try:
+            # Progress is only edited every few seconds, runs can take a while
+            while not run.done():
+                await asyncio.wait({run}, timeout=SUBBRUTE_PROGRESS_INTERVAL)
+                if not run.done():
+                    await status.edit(embed=subbrute_progress(job, "in progress ⏳"))
+
+            found = sorted(run.result(), key=lambda row: row["host"])
+            embed = subbrute_progress(job, "finished ✅" if job.finished else "stopped ⏸️")
+            attachments = [discord.File(rows_to_csv(found), filename=f"subbrute_{job.domain}.csv")] if found else []
+            await status.edit(embed=embed, attachments=attachments)
+            logger.info(f" Subdomain brute force of {job.domain} {'finished' if job.finished else 'stopped'}: {len(found)} found in {job.done} tries")
+
+        except Exception as e:
+            logger.error(f"Subdomain brute force error for `{job.domain}`: {e}")
+            await ctx.send(f"An error occurred while brute forcing `{job.domain}`, progress was saved")
+
+        finally:
+            if not run.done():
+                job.stop()
+                await asyncio.gather(run, return_exceptions=True)
+            self.brute_jobs.pop(key, None)
+
+
+    @commands.command(help="Audits the DNS of a domain: zone transfer on every nameserver, DNSSEC chain of trust, SPF include chain, DMARC and common DKIM selectors. The full report is attached as JSON.")
+    async def dnsaudit(self, ctx, domain: str):
+        logger.info(f" Audit of {domain}\nUser: {ctx.author}\nServer: {ctx.guild}")
+        await ctx.message.add_reaction("👓")
+
+        domain = normalize_host(domain)
+        if domain is None:
+            return await ctx.send("Invalid domain.")
+
+        try:
+            async with ctx.typing():
+                report = await audit.audit(domain)
+            file = discord.File(io.BytesIO(json.dumps(report, indent=2).encode()), filename=f"dnsaudit_{domain}.json")
+            await paginator.send(ctx, audit_embeds(report), ctx.author.id, file=file)
+
+        except Exception as e:
+            logger.error(f"DNS audit error for `{domain}`: {e}")
+            await ctx.send("An error occurred while auditing the domain")
+
+
+    @commands.command(help="Shows the statistics of the DNS answer cache.")
+    async def dnscache(self, ctx):
+        stats = dnslookup.cache.stats()
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        ratio = ((stats["hits"] + stats["negative_hits"]) / lookups * 100) if lookups else 0
+
+        embed = discord.Embed(
+            title="DNS Cache Stats 🗃️",
+            description=(
+                f"◈ **Entries**: {stats['entries']} ({stats['negative_entries']} negative)\n\n"
+                f"◈ **Hits**: {stats['hits']} (+{stats['negative_hits']} negative)\n\n"
+                f"◈ **Misses**: {stats['misses']}\n\n"
+                f"◈ **Hit rate**: {ratio:.1f}%\n\n"
+                f"◈ **Evictions**: {stats['evictions']}"
+            ),
+            color=discord.Color.dark_green()
+        )
+        embed.set_footer(text="Dumb Name Service")
+        embed.set_author(name="The Resolver 🧙‍♂️", icon_url="https://play.pokemonshowdown.com/sprites/trainers/bryony.png")
+        await ctx.send(embed=embed)
+
+
+    @commands.command(help="Shows the upstream resolvers in use and their health.")
+    async def dnsupstreams(self, ctx):
+        if dnslookup.upstreams is None:
+            return await ctx.send("Using the system resolver. Set `DNS_UPSTREAMS` to use custom (DoT/DoH) resolvers.")
+
+        lines = [
+            f"{'🟢' if upstream['up'] else '🔴'} `{upstream['name']}` · {upstream['latency_ms']} ms · {upstream['failures']}/{upstream['queries']} failed"
+            for upstream in dnslookup.upstreams.stats()
+        ]
+        embed = discord.Embed(
+            title="DNS Upstreams 📡",
+            description="\n\n".join(lines),
+            color=discord.Color.dark_green()
+        )
+        embed.set_footer(text=f"Dumb Name Service · The {dnslookup.upstreams.race} healthiest are raced")
+        embed.set_author(name="The Resolver 🧙‍♂️", icon_url="https://play.pokemonshowdown.com/sprites/trainers/bryony.png")
+        await ctx.send(embed=embed)
+
 
 async def setup(bot):
     await bot.add_cog(DNS(bot))
\ No newline at end of file
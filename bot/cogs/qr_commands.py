@@ -1,19 +1,70 @@
+import io
 import logging
+from contextlib import aclosing
+import os
+import time
 import discord
 from discord.ext import commands
 from typing import Optional
+from utils.qrcode.batch import BatchZip, parse_payloads, render_batch, MAX_FILE_SIZE, MAX_CODES, UPLOAD_LIMIT, INDEX_RESERVE
+from utils.qrcode.engine import FORMATS, DEFAULT_FORMAT, logo_width
+from utils.qrcode.logo_fetcher import LogoFetcher
 from utils.qrcode.qr_str import generate_qr
-from utils.qrcode.qr_wifi import generate_wifi_qr
+from utils.qrcode.qr_wifi import generate_wifi_qr, wifi_payload
+from utils.qrcode.render_cache import RenderCache, cache_key
+from utils.qrcode.render_pool import RenderPool, RenderQueueFull, RenderTimeout, WORKERS
 
 logger = logging.getLogger("QR")
+QR_WORKERS = int(os.getenv("QR_WORKERS", str(WORKERS)))  # Render processes, one per core by default
+QR_QUEUE = int(os.getenv("QR_QUEUE", "32"))  # Renders waiting for a worker before new ones are rejected
+QR_TIMEOUT = float(os.getenv("QR_TIMEOUT", "15"))
+QR_CACHE_MB = int(os.getenv("QR_CACHE_MB", "32"))  # Memory budget of rendered QRs
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR") or None  # Evicted QRs spill here when set (never WiFi ones)
+QR_BATCH_MAX_JOBS = int(os.getenv("QR_BATCH_MAX_JOBS", "2"))
+EDIT_INTERVAL = 1.5  # Seconds between progress edits
+
+
+def qr_embed(title: str) -> discord.Embed:
+    embed = discord.Embed(title=title, colour=discord.Colour.from_rgb(255, 255, 255))
+    embed.set_footer(text="Real ones keep it square, no cap 📐")
+    embed.set_author(name="The Bronx 📦", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/a/ab/latest/20230122133600/Periscopio_EP.png")
+    return embed
+
+
+def batch_progress(done: int, total: int, failed: int, start: float) -> discord.Embed:
+    embed = qr_embed(f"QR Batch {'finished ✅' if done == total else 'in progress ⏳'}")
+    embed.description = f"◈ **Rendered**: {done - failed}/{total}\n\n◈ **Failed**: {failed}\n\n◈ **Elapsed**: {time.monotonic() - start:.1f}s"
+    return embed
+
 
 class QR(commands.Cog):
     """Generates a QR code image from the given data with an optional logo, avaible for text, URL and WiFi."""
     def __init__(self, bot):
         self.bot = bot
-
-    @commands.command(help="Generates a QR code image from the given data with an optional logo.")
-    async def genQR(self, ctx, data, logo_url: Optional[str] = None):
+        self.pool = RenderPool(logger, QR_WORKERS, QR_QUEUE, QR_TIMEOUT)
+        self.logos = LogoFetcher()
+        self.cache = RenderCache(QR_CACHE_MB * 1024 * 1024, QR_CACHE_DIR)
+        self.batches = 0
+
+    async def cog_load(self):
+        self.pool.start()
+
+    async def cog_unload(self):
+        self.pool.close()
+        await self.logos.close()
+
+    async def render_qr(self, data: str, logo: Optional[bytes], format: str) -> bytes:
+        """A QR of `data` from the cache, or rendered in the pool and cached."""
+        key = cache_key(data, logo, format)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        qr = (await self.pool.render(generate_qr, data, logo, format)).getvalue()
+        self.cache.put(key, qr)
+        return qr
+
+    @commands.command(help="Generates a QR code image from the given data with an optional logo. Add png, svg or webp to pick the format (png by default).")
+    async def genQR(self, ctx, data, *options):
         logger.info(f" QR generation asked \nData: {data} \nUser: {ctx.author.name}\nServer: {ctx.guild.name}\nChannel: {ctx.channel.name}\n")
         await ctx.message.add_reaction("📷")
 
@@ -21,16 +72,30 @@ class QR(commands.Cog):
             logger.error(f" Invalid data given")
             return await ctx.send("Empty or invalid data to include in the QR.")
 
+        format = DEFAULT_FORMAT
+        logo_url = None
+        for option in options:
+            if option.lower() in FORMATS:
+                format = option.lower()
+            elif logo_url is None:
+                logo_url = option
+            else:
+                return await ctx.send("Too many arguments.")
+
 
         try:
-            if logo_url:
-                qr = generate_qr(data, logo_url)
-            else:
-                qr = generate_qr(data)
+            logo = await self.logos.get(logo_url, logo_width(data)) if logo_url else None
+            qr = io.BytesIO(await self.render_qr(data, logo, format))
+
+        except RenderQueueFull:
+            return await ctx.send("Too many QR codes being generated right now, try again in a moment folk.")
+
+        except RenderTimeout:
+            return await ctx.send("QR generation took too long. Try a smaller logo or less data.")
 
         except ValueError as e:
             logger.error(f"QR generation failed: {e}")
-            await ctx.send(f"Couldn't load the given logo. Make sure that the URL points to a valid image format. Content-Type must starts with 'image/'.")
+            await ctx.send(f"Couldn't load the given logo ({e}). Make sure that the URL points to a valid image format. Content-Type must starts with 'image/'.")
             return
 
         except Exception as e:
@@ -39,7 +104,7 @@ class QR(commands.Cog):
             return
 
 
-        file = discord.File(qr, filename="qr.png")
+        file = discord.File(qr, filename=f"qr.{format}")
         embed = discord.Embed(
             title = f"QR Code 📷",
             description = f"""◈ **Data**: {data}""",
@@ -48,14 +113,15 @@ class QR(commands.Cog):
         embed.set_footer(text="Real ones keep it square, no cap 📐")
         embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/medicham-mega.gif")
         embed.set_author(name="The Bronx 📦", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/a/ab/latest/20230122133600/Periscopio_EP.png")
-        embed.set_image(url="attachment://qr.png")
+        if format != "svg":  # Embeds can't show SVGs, it's sent as a plain attachment
+            embed.set_image(url=f"attachment://qr.{format}")
 
 
         logger.info(f" Sent QR to {ctx.author.name}\n")
         await ctx.send(embed=embed, file=file)
 
 
-    @commands.command(help="Generates a WiFi QR code image that can be scanned to connect automatically. You can specify an unprotected network in security arg by passing \"nopass\" and skip the password arg. Command is only available in DMs.")
+    @commands.command(help="Generates a WiFi QR code image that can be scanned to connect automatically. You can specify an unprotected network in security arg by passing \"nopass\" and skip the password arg. Add png, svg or webp at the end to pick the format. Command is only available in DMs.")
     async def wifiQR(self, ctx, *args):
         if not isinstance(ctx.channel, discord.DMChannel):
             return await ctx.send("Command only available in DMs.")
@@ -67,7 +133,10 @@ class QR(commands.Cog):
         security = args[1].upper().strip()
         password = None
         logo_url = None
-
+        format = DEFAULT_FORMAT
+        if len(args) > (2 if security == "nopass" else 3) and args[-1].lower() in FORMATS:
+            format = args[-1].lower()
+            args = args[:-1]
 
         if security == "nopass":
             if len(args) == 3:
@@ -101,21 +170,37 @@ class QR(commands.Cog):
 
 
         try:
-            if logo_url:
-                qr = generate_wifi_qr(ssid, security, password, logo_url)
+            payload = wifi_payload(ssid, security, password)
+        except ValueError as e:
+            logger.error(f" Invalid data given: {e}")
+            return await ctx.send(f"{e}.")
+
+        try:
+            logo = await self.logos.get(logo_url, logo_width(payload)) if logo_url else None
+            key = cache_key(payload, logo, format)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                qr = io.BytesIO(cached)
             else:
-                qr = generate_wifi_qr(ssid, security, password)
+                qr = await self.pool.render(generate_wifi_qr, ssid, security, password, logo, format)
+                self.cache.put(key, qr.getvalue(), persist=False)  # Contains the password, memory only
+
+        except RenderQueueFull:
+            return await ctx.send("Too many QR codes being generated right now, try again in a moment folk.")
+
+        except RenderTimeout:
+            return await ctx.send("QR generation took too long. Try a smaller logo.")
 
         except ValueError as e:
             logger.error(f"QR generation failed: {e}")
-            return await ctx.send(f"Couldn't load the given logo. Make sure that the URL points to a valid image format. Content-Type must start with 'image/'.")
+            return await ctx.send(f"Couldn't load the given logo ({e}). Make sure that the URL points to a valid image format. Content-Type must start with 'image/'.")
 
         except Exception as e:
             logger.error(f"Unexpected error during QR generation: {e}")
             return await ctx.send("Unexpected error while QR generation.")
 
 
-        file = discord.File(qr, filename="qr.png")
+        file = discord.File(qr, filename=f"qr.{format}")
         embed = discord.Embed(
             title = f"QR Code 📷",
             description = f"""◈ **SSID**: {ssid}\n\n◈ **Security**: {security}\n""",
@@ -124,13 +209,111 @@ class QR(commands.Cog):
         embed.set_footer(text="Real ones keep it square, no cap 📐")
         embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/medicham-mega.gif")
         embed.set_author(name="The Bronx 📦", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/a/ab/latest/20230122133600/Periscopio_EP.png")
-        embed.set_image(url="attachment://qr.png")
+        if format != "svg":  # Embeds can't show SVGs, it's sent as a plain attachment
+            embed.set_image(url=f"attachment://qr.{format}")
 
 
         logger.info(f" Sent Wifi QR to {ctx.author.name}\n")
         await ctx.send(embed=embed, file=file)
 
 
+    @commands.command(help=f"Generates a QR code for every line of an attached .txt/.csv file and sends them in a ZIP. CSV rows can be `name,payload` to name the files (max {MAX_CODES} codes).\nUsage: `qrbatch [png|svg|webp] [logo_url]`")
+    async def qrbatch(self, ctx, *options):
+        logger.info(f" QR batch asked\nUser: {ctx.author}\nServer: {ctx.guild}")
+        await ctx.message.add_reaction("📷")
+
+        format = DEFAULT_FORMAT
+        logo_url = None
+        for option in options:
+            if option.lower() in FORMATS:
+                format = option.lower()
+            elif logo_url is None:
+                logo_url = option
+            else:
+                return await ctx.send("Too many arguments.")
+
+        attachment = next((a for a in ctx.message.attachments if a.filename.lower().endswith((".txt", ".csv"))), None)
+        if attachment is None:
+            return await ctx.send("Attach a .txt or .csv file with one payload per line.")
+        if attachment.size > MAX_FILE_SIZE:
+            return await ctx.send(f"The attached file is too big (max {MAX_FILE_SIZE // 1024} KB).")
+        if self.batches >= QR_BATCH_MAX_JOBS:
+            return await ctx.send("There are already QR batches being generated, try again in a moment folk.")
+
+        # The slot is taken before anything is awaited, so batches sent at the same time can't go over the limit
+        self.batches += 1
+        try:
+            try:
+                entries = parse_payloads((await attachment.read()).decode(errors="ignore"), columns=attachment.filename.lower().endswith(".csv"))
+            except ValueError as e:
+                return await ctx.send(f"{e}.")
+            if not entries:
+                return await ctx.send("The attached file is empty.")
+
+            # Fetched once for the whole batch, sized for the biggest QR and scaled down for the rest in the workers
+            logo = None
+            if logo_url:
+                try:
+                    logo = await self.logos.get(logo_url, logo_width(max((payload for _, payload in entries), key=len)))
+                except ValueError as e:
+                    logger.error(f"QR batch logo failed: {e}")
+                    return await ctx.send(f"Couldn't load the given logo ({e}). Make sure that the URL points to a valid image format. Content-Type must start with 'image/'.")
+
+            limit = ctx.guild.filesize_limit if ctx.guild is not None else UPLOAD_LIMIT
+            start = time.monotonic()
+            archive = BatchZip(format)
+            done = failed = 0
+            status = await ctx.send(embed=batch_progress(0, len(entries), 0, start))
+            last_edit = time.monotonic()
+
+            # As many renders at once as workers, so a batch doesn't fill the queue for everyone else
+            async with aclosing(render_batch(entries, lambda data: self.render_qr(data, logo, format), self.pool.workers)) as results:
+                async for name, payload, image, error in results:
+                    if image is not None and archive.size + len(image) + INDEX_RESERVE > limit:
+                        # Stopped before rendering the rest, a ZIP over the limit could never be uploaded
+                        embed = batch_progress(done, len(entries), failed, start)
+                        embed.title = "QR Batch stopped ⛔"
+                        embed.description += (f"\n\n◈ **Stopped**: the ZIP would go over the {limit // (1024 * 1024)} MB upload limit. "
+                                              f"Split the file or use webp and no logo for smaller codes.")
+                        await status.edit(embed=embed)
+                        logger.info(f" QR batch stopped at {done}/{len(entries)} codes, over the upload limit\nUser: {ctx.author}")
+                        return
+
+                    archive.add(name, payload, image, error)
+                    done += 1
+                    failed += image is None
+                    if time.monotonic() - last_edit >= EDIT_INTERVAL:
+                        await status.edit(embed=batch_progress(done, len(entries), failed, start))
+                        last_edit = time.monotonic()
+
+            await status.edit(embed=batch_progress(done, len(entries), failed, start), attachments=[discord.File(archive.close(), filename="qrbatch.zip")])
+            logger.info(f" QR batch of {len(entries)} codes finished in {time.monotonic() - start:.1f}s ({failed} failed)\nUser: {ctx.author}")
+
+        except Exception as e:
+            logger.error(f"QR batch error: {e}")
+            await ctx.send("An error occurred while generating the QR batch")
+
+        finally:
+            self.batches -= 1
+
+
+    @commands.command(help="Shows the load of the QR render workers, their render times and the caches.")
+    async def qrstats(self, ctx):
+        stats = self.pool.stats()
+        logos = self.logos.stats()
+        cache = self.cache.stats()
+        embed = qr_embed("QR Render Stats 📊")
+        embed.description = (
+            f"◈ **Workers**: {stats['running']}/{stats['workers']} busy\n\n"
+            f"◈ **Queue**: {stats['queued']} waiting\n\n"
+            f"◈ **Rendered**: {stats['completed']} ({stats['failed']} failed, {stats['timeouts']} timed out, {stats['rejected']} rejected)\n\n"
+            f"◈ **Render time**: {stats['avg_ms']:.0f} ms avg, {stats['p95_ms']:.0f} ms p95\n\n"
+            f"◈ **Logo cache**: {logos['entries']} logos, {logos['hits']} hits, {logos['misses']} downloads\n\n"
+            f"◈ **QR cache**: {cache['entries']} QRs ({cache['bytes'] // 1024} KB), {cache['disk_entries']} on disk ({cache['disk_bytes'] // 1024} KB), "
+            f"{cache['hits'] + cache['disk_hits']} hits, {cache['misses']} misses"
+        )
+        await ctx.send(embed=embed)
+
 
 async def setup(bot):
     await bot.add_cog(QR(bot))
\ No newline at end of file
@@ -1,41 +1,193 @@
+import asyncio
 import logging
 import os
 import discord
 from discord.ext import commands
 from hashlib import sha256
 from utils.vt.VTApiHandler import VTApiHandler
+from utils.vt.verdict_cache import VerdictCache, classify, MALICIOUS
+from utils.vt.scheduler import VTScheduler, BACKGROUND
+from utils.vt.autoscan import AutoScanner
+from utils.vt.extractor import extract_indicators
+from utils.vt.batch import parse_indicators, results_to_csv, verdict_of, vt_link, VERDICT_ICONS, MAX_INDICATORS, MAX_FILE_SIZE
+from utils.vt.analysis_tracker import AnalysisTracker
+from utils.embeds import paginator
 
 
 logger = logging.getLogger("VT")
 VT_API_KEY = os.getenv("VT_API_KEY")
 if VT_API_KEY is None:
     logger.error(" No VirusTotal API key found. Please create a .env file with the VT_API_KEY variable.")
+VT_CONN_LIMIT_PER_HOST = int(os.getenv("VT_CONN_LIMIT_PER_HOST", "10"))
+VT_CACHE_DB = os.getenv("VT_CACHE_DB")  # Optional SQLite file to keep verdicts across restarts
+VT_REQUESTS_PER_MINUTE = int(os.getenv("VT_REQUESTS_PER_MINUTE", "4"))  # Public API tier: 4/min, 500/day
+VT_REQUESTS_PER_DAY = int(os.getenv("VT_REQUESTS_PER_DAY", "500"))
+VT_URL_VALIDATION = os.getenv("VT_URL_VALIDATION", "syntactic")  # syntactic, cached or probe
+VT_MAX_POLLERS = int(os.getenv("VT_MAX_POLLERS", "4"))  # Analyses followed at the same time
+VT_AUTOSCAN = os.getenv("VT_AUTOSCAN", "0") == "1"  # Scan URLs and IPs posted in any channel, not only the ones set with !autoscan
+VT_AUTOSCAN_WORKERS = int(os.getenv("VT_AUTOSCAN_WORKERS", "4"))
+BATCH_MAX_SHOWN = 60  # Longer indicators are truncated in the embed, the CSV has them in full
+
+
+class QueueNotice:
+    """Tells the user a request is waiting for VirusTotal quota and reuses that message for the final reply."""
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.message = None
+
+    async def __call__(self, position: int, eta: float):
+        embed = discord.Embed(
+            title="Queued ⏳",
+            description=f"Waiting for VirusTotal API quota (position {position}, ~{eta:.0f}s).",
+            colour=discord.Colour.orange()
+        )
+        embed.set_footer(text="Powered by VirusTotal")
+        if self.message is not None:
+            await self.message.edit(embed=embed)
+        else:
+            self.message = await self.ctx.send(embed=embed)
+
+    async def send(self, content=None, embed=None):
+        if self.message is not None:
+            return await self.message.edit(content=content, embed=embed)
+        return await self.ctx.send(content=content, embed=embed)
+
+
+def flagged(config, stats: dict) -> bool:
+    """Whether a report exceeds the guild's VirusTotal thresholds (the defaults when `config` is `None`)."""
+    if config is None:
+        return classify(stats) == MALICIOUS
+    return classify(stats, config.vt_malicious, config.vt_suspicious) == MALICIOUS
+
+
+def file_embed(filename: str, file_hash: str, stats: dict, status: str = "completed", config=None) -> discord.Embed:
+    """Builds the File Analyzer embed for a finished report or an analysis still in progress."""
+    if status != "completed":
+        color = discord.Colour.orange()
+        image = "https://static.wikia.nocookie.net/robloxpokemonbrickbronze/images/d/d8/Metal_Coat_DW.png"
+        if status in ("timeout", "error"):
+            title = f"Couldn't follow the analysis of {filename} 🤔"
+            footer_note = "Check the results manually on VirusTotal."
+        else:
+            title = f"Analyzing {filename}... ⏳"
+            footer_note = f"Status: {status}. This message will update as engines report in."
+
+    elif flagged(config, stats):
+        color = discord.Colour.red()
+        title = f"ALERT: {filename} wants to ruin your day! 💢"
+        image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-heat.gif"
+        footer_note = "Click on the title to see more details on VirusTotal."
+
+    else:
+        color = discord.Colour.green()
+        title = f"{filename} is safe! But stay sharp! 👀"
+        image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-mow.gif"
+        footer_note = "Click on the title to see more details on VirusTotal."
+
+
+    embed = discord.Embed(
+        title=title,
+        description=(
+            f"💀 **Malicious**: {stats.get('malicious', 0)}\n\n"
+            f"🚨 **Suspicious**: {stats.get('suspicious', 0)}\n\n"
+            f"✔️ **Harmless**: {stats.get('harmless', 0)}\n\n"
+            f"👻 **Undetected**: {stats.get('undetected', 0)}\n\n"
+            f"{footer_note}"
+        ),
+        colour=color
+    )
+    embed.set_footer(text="Powered by VirusTotal")
+    embed.set_thumbnail(url=image)
+    embed.set_author(name="File Analyzer 📝", url=f"https://www.virustotal.com/gui/file/{file_hash}", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
+    return embed
+
 
 class VT(commands.Cog):
     """They check if a URL or an IP is malicious using VirusTotal API and return a report if exists. Also, you can ask for a file analysis attaching it. The API key must be set in the .env file. Format for requests <https://domain> for URLs and <IP> only needed for IPs"""
     def __init__(self, bot):
         self.bot = bot
-        self.apiHandler = VTApiHandler(logger, str(VT_API_KEY))
+        self.apiHandler = VTApiHandler(logger, str(VT_API_KEY), limit_per_host=VT_CONN_LIMIT_PER_HOST,
+                                       cache=VerdictCache(db_path=VT_CACHE_DB),
+                                       scheduler=VTScheduler(VT_REQUESTS_PER_MINUTE, VT_REQUESTS_PER_DAY),
+                                       tracker=AnalysisTracker(logger, max_pollers=VT_MAX_POLLERS),
+                                       url_validation=VT_URL_VALIDATION)
+        self.autoscan = AutoScanner(logger, self.apiHandler, self.autoscan_alert, workers=VT_AUTOSCAN_WORKERS,
+                                    is_malicious=lambda message, stats: flagged(self.guild_config(message.guild), stats))
+
+    def guild_config(self, guild):
+        return self.bot.guild_config.get(guild.id if guild else None)
+
+    async def cog_load(self):
+        await self.apiHandler.start()
+        self.autoscan.start()
+
+    async def cog_unload(self):
+        await self.autoscan.close()
+        await self.apiHandler.close()
+        self.apiHandler.cache.close()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.author.bot or message.guild is None:
+            return
+
+        config = self.guild_config(message.guild)
+        if not (VT_AUTOSCAN or message.channel.id in config.autoscan_channels) or self.qualified_name in config.disabled_cogs:
+            return
+
+        indicators = extract_indicators(message.content)
+        if not indicators:
+            return
+
+        # Commands like !vt_url already report back, don't scan them twice
+        if (await self.bot.get_context(message)).valid:
+            return
+
+        for kind, indicator in indicators:
+            self.autoscan.submit(message, kind, indicator, scope=message.channel.id)
+
+    async def autoscan_alert(self, message: discord.Message, kind: str, indicator: str, result: dict):
+        logger.warning(f" Auto scan flagged {indicator} \nUser: {message.author.name}\nServer: {message.guild.name}\nChannel: {message.channel.name}\n")
+        embed = discord.Embed(
+            title=f"ALERT: {'<' + indicator + '>' if kind == 'url' else indicator} wants to ruin your day! 💢",
+            description=(
+                f"💀 **Malicious**: {result['malicious']}\n\n"
+                f"🚨 **Suspicious**: {result['suspicious']}\n\n"
+                f"Think twice before clicking. Click on the title to see more details on VirusTotal."
+            ),
+            colour=discord.Colour.red(),
+            url=vt_link(kind, indicator)
+        )
+        embed.set_footer(text="Powered by VirusTotal")
+        embed.set_thumbnail(url="https://play.pokemonshowdown.com/sprites/gen5ani/rotom-heat.gif")
+        embed.set_author(name="Auto Scan 🛡️", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
+
+        try:
+            await message.reply(embed=embed, mention_author=False)
+        except discord.HTTPException as e:
+            logger.error(f" Couldn't send auto scan alert: {e}")
+
 
     @commands.command(help="Checks if a URL is malicious using VirusTotal API and returns a report if exists.")
     async def vt_url(self, ctx, url: str):
         logger.info(f" Report asked for URL: {url} \nUser: {ctx.author.name}\nServer: {ctx.guild.name}\nChannel: {ctx.channel.name}\n")
         await ctx.message.add_reaction("🔍")
 
-        result = await self.apiHandler.url_result(url)
+        notice = QueueNotice(ctx)
+        result = await self.apiHandler.url_result(url, on_queued=notice)
         if result is False:
             logger.error(f" Invalid URL: {url}\n")
-            return await ctx.send("Invalid URL or WAF is blocking the request. Verify if/that is a valid URL or check it manually on VirusTotal.")
+            return await notice.send("Invalid or unreachable URL. Verify that it is a valid http(s) URL or check it manually on VirusTotal.")
 
 
         if isinstance(result, str) and (result.startswith("There was an error") or result.startswith("Request failed")):
             logger.error(f" Error while requesting report for: {url}\n")
-            return await ctx.send(result)
+            return await notice.send(result)
 
 
         if isinstance(result, dict):
             logger.info(f" Report acquired for URL: {url} \nUser: {ctx.author.name}\n")
-            if result["malicious"] > 0 or result["suspicious"] > 2:
+            if flagged(self.guild_config(ctx.guild), result):
                 color = discord.Colour.red()
                 title = f"ALERT: <{url}> wants to ruin your day! 💢"
                 image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-heat.gif"
@@ -72,7 +224,7 @@ class VT(commands.Cog):
             embed.set_thumbnail(url="https://static.wikia.nocookie.net/robloxpokemonbrickbronze/images/d/d8/Metal_Coat_DW.png")
             embed.set_author(name="URL Check", url=f"https://www.virustotal.com/gui/url/{sha256(url.encode()).hexdigest()}", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
 
-        await ctx.send(embed=embed)
+        await notice.send(embed=embed)
 
 
     @commands.command(help="Check if an IP is malicious using VirusTotal API and returns a report if exists.")
@@ -80,20 +232,21 @@ class VT(commands.Cog):
         logger.info(f" Report asked for IP: {ip} \nUser: {ctx.author.name}\nServer: {ctx.guild.name}\nChannel: {ctx.channel.name}\n")
         await ctx.message.add_reaction("🔍")
 
-        result = await self.apiHandler.ip_result(ip)
+        notice = QueueNotice(ctx)
+        result = await self.apiHandler.ip_result(ip, on_queued=notice)
         if result is False:
             logger.error(f" Invalid IP address: {ip}\n")
-            return await ctx.send("Invalid IP address. Verify if/that is a public IP and it has a valid format. Maybe the WAF is blocking the request.")
+            return await notice.send("Invalid IP address. Verify if/that is a public IP and it has a valid format. Maybe the WAF is blocking the request.")
 
 
         if isinstance(result, str) and (result.startswith("There was an error") or result.startswith("Request failed")):
             logger.error(f" Error while requesting report for: {ip}\n")
-            return await ctx.send(result)
+            return await notice.send(result)
 
 
         if isinstance(result, dict):
             logger.info(f" Report acquired for IP: {ip} \nUser: {ctx.author.name}\n")
-            if result["malicious"] > 0 or result["suspicious"] > 2:
+            if flagged(self.guild_config(ctx.guild), result):
                 color = discord.Colour.red()
                 title = f"ALERT: {ip} wants to ruin your day! 💢"
                 image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-heat.gif"
@@ -130,7 +283,7 @@ class VT(commands.Cog):
             embed.set_thumbnail(url="https://static.wikia.nocookie.net/robloxpokemonbrickbronze/images/d/d8/Metal_Coat_DW.png/revision/latest?cb=20161009161420")
             embed.set_author(name="IP Check", url=f"https://www.virustotal.com/gui/ip-address/{ip}", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
 
-        await ctx.send(embed=embed)
+        await notice.send(embed=embed)
 
 
 
@@ -138,51 +291,103 @@ class VT(commands.Cog):
     async def vt_file(self, ctx):
         logger.info(f" File Analysis asked \nUser: {ctx.author.name}\nServer: {ctx.guild.name}\nChannel: {ctx.channel.name}\n")
         await ctx.message.add_reaction("🔍")
-        title = ctx.message.attachments[0].filename
-        file = await ctx.message.attachments[0].read()
-        
+        if not ctx.message.attachments:
+            return await ctx.send("Attach the file you want to analyze to the message.")
+        attachment = ctx.message.attachments[0]
+        title = attachment.filename
+
 
-        result = await self.apiHandler.file_upload_and_analyze(file, title)
+        notice = QueueNotice(ctx)
+        result = await self.apiHandler.file_stream_and_analyze(attachment.url, title, attachment.size, on_queued=notice)
         if result is False:
             logger.error(f" File couldn't be uploaded: {title}\n")
-            return await ctx.send(" File couldn't be uploaded. Max size for VirusTotal API is 32MB at the moment. Try to compress the file or upload it to the website directly.")
+            return await notice.send(" File couldn't be uploaded. Max size for VirusTotal API is 32MB at the moment. Try to compress the file or upload it to the website directly.")
 
 
-        if isinstance(result, str) and (result.startswith("There was an error") or result.startswith("Upload failed")):
+        if isinstance(result, str):
             logger.error(f" Error while requesting report for: {title}\n")
-            return await ctx.send(result)
+            return await notice.send(result)
 
 
         if isinstance(result, tuple):
-            result, md5_hash = result
-            logger.info(f" Report acquired for: {title} \nUser: {ctx.author.name}\n")
-            if result["malicious"] > 0 or result["suspicious"] > 2:
-                color = discord.Colour.red()
-                title = f"ALERT: {title} wants to ruin your day! 💢"
-                image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-heat.gif"
+            stats, file_hash, analysis_id = result
+            if analysis_id is None:
+                logger.info(f" Report acquired for: {title} \nUser: {ctx.author.name}\n")
+                return await notice.send(embed=file_embed(title, file_hash, stats, config=self.guild_config(ctx.guild)))
 
-            else:
-                color = discord.Colour.green()
-                title = f"{title} is safe! But stay sharp! 👀"
-                image = "https://play.pokemonshowdown.com/sprites/gen5ani/rotom-mow.gif"
+            # New sample: answer right away and let the tracker edit the embed as engines report in
+            logger.info(f" Tracking analysis for: {title} \nUser: {ctx.author.name}\n")
+            message = await notice.send(embed=file_embed(title, file_hash, {}, "queued"))
 
+            async def on_update(status: str, stats: dict):
+                try:
+                    await message.edit(embed=file_embed(title, file_hash, stats, status, self.guild_config(ctx.guild)))
+                except discord.HTTPException as e:
+                    logger.error(f" Couldn't update analysis embed for {title}: {e}")
 
-            embed = discord.Embed(
-                title=title,
-                description=(
-                    f"💀 **Malicious**: {result['malicious']}\n\n"
-                    f"🚨 **Suspicious**: {result['suspicious']}\n\n"
-                    f"✔️ **Harmless**: {result['harmless']}\n\n"
-                    f"👻 **Undetected**: {result['undetected']}\n\n"
-                    f"Click on the title to see more details on VirusTotal."
-                ),
-                colour=color
-            )
-            embed.set_footer(text="Powered by VirusTotal")
-            embed.set_thumbnail(url=image)
-            embed.set_author(name="File Analyzer 📝", url=f"https://www.virustotal.com/gui/file/{md5_hash}", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
+            self.apiHandler.track_analysis(analysis_id, file_hash, on_update)
+
+
+    @commands.command(help=f"Checks a list of URLs and IPs (in the message or an attached .txt/.csv) using VirusTotal API. Up to {MAX_INDICATORS} indicators, returns a summary and a CSV report.")
+    async def vt_batch(self, ctx, *, indicators: str = ""):
+        logger.info(f" Batch report asked \nUser: {ctx.author.name}\nServer: {ctx.guild.name}\nChannel: {ctx.channel.name}\n")
+        await ctx.message.add_reaction("🔍")
 
-            await ctx.send(embed=embed)
+        text = indicators
+        for attachment in ctx.message.attachments:
+            if not attachment.filename.lower().endswith((".txt", ".csv")):
+                continue
+            if attachment.size > MAX_FILE_SIZE:
+                return await ctx.send(f"The attached list is too big (max {MAX_FILE_SIZE // 1024} KB).")
+            text += "\n" + (await attachment.read()).decode(errors="ignore")
+
+        targets, invalid = parse_indicators(text)
+        if not targets:
+            return await ctx.send("No valid public IPs or http(s) URLs found. Paste them after the command or attach a .txt/.csv file.")
+        if len(targets) > MAX_INDICATORS:
+            return await ctx.send(f"Too many indicators ({len(targets)}). The limit is {MAX_INDICATORS} per batch.")
+
+        scheduler = self.apiHandler.scheduler
+        eta = scheduler.eta(scheduler.position(BACKGROUND) + len(targets) - 1)
+        status = await ctx.send(f"🔍 Checking {len(targets)} indicators ({len(invalid)} ignored), ~{eta:.0f}s at worst...")
+
+        async def check(kind: str, indicator: str):
+            if kind == "ip":
+                return await self.apiHandler.ip_result(indicator, priority=BACKGROUND)
+            return await self.apiHandler.url_result(indicator, priority=BACKGROUND)
+
+        results = await asyncio.gather(*(check(kind, indicator) for kind, indicator in targets))
+        rows = [(kind, indicator, result) for (kind, indicator), result in zip(targets, results)]
+        logger.info(f" Batch report acquired for {len(rows)} indicators \nUser: {ctx.author.name}\n")
+
+        config = self.guild_config(ctx.guild)
+        verdicts = [verdict_of(result, config.vt_malicious, config.vt_suspicious) for _, _, result in rows]
+        malicious = verdicts.count("malicious")
+        lines = [f"{VERDICT_ICONS[verdict]} [{indicator[:BATCH_MAX_SHOWN]}]({vt_link(kind, indicator)})" for (kind, indicator, _), verdict in zip(rows, verdicts)]
+
+        template = discord.Embed(
+            title=f"Batch Check: {malicious} malicious out of {len(rows)} 💢" if malicious else f"Batch Check: nothing malicious out of {len(rows)} 👀",
+            colour=discord.Colour.red() if malicious else discord.Colour.green()
+        )
+        template.set_footer(text="Powered by VirusTotal")
+        template.set_author(name="Batch Checker 📋", icon_url="https://images.wikidexcdn.net/mwuploads/wikidex/4/49/latest/20231030185416/Repelente_EP.png?20231030185416")
+
+        await status.delete()
+        file = discord.File(results_to_csv(rows, config.vt_malicious, config.vt_suspicious), filename="vt_batch.csv")
+        await paginator.send(ctx, paginator.paginate_lines(lines, template), ctx.author.id, file=file)
+
+
+    @commands.command(help="Shows the hit/miss counters of the VirusTotal verdict cache and today's API quota usage.")
+    async def vt_cache(self, ctx):
+        stats = self.apiHandler.cache.stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = (stats["hits"] / total * 100) if total else 0
+        quota = self.apiHandler.scheduler.stats()
+        await ctx.send(
+            f"🗃️ Verdict cache: {stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses ({ratio:.1f}% hit rate).\n"
+            f"⏳ Quota: {quota['used_today']}/{quota['per_day']} requests today, {quota['queued']} queued, {quota['in_flight']} in flight.\n"
+            f"🛡️ Auto scan: {'all channels' if VT_AUTOSCAN else f'{len(self.guild_config(ctx.guild).autoscan_channels)} channels'}, {self.autoscan.stats()['queued']} queued, {self.autoscan.stats()['dropped']} dropped."
+        )
 
 async def setup(bot):
     await bot.add_cog(VT(bot))
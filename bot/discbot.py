@@ -6,53 +6,78 @@ from discord.ext import commands
 from discord import Intents
 from dotenv import load_dotenv
 from pretty_help import AppMenu, PrettyHelp, AppNav
+from utils.config.guild_config import GuildConfigStore, DEFAULT_PREFIX
 
-load_dotenv()
-logging.basicConfig(level=logging.INFO)
-DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+# Nothing runs at import time: the QR render workers import this module again (as `__mp_main__`), everything with side
+# effects (.env, the guild settings database, the bot) is set up in `main`
 logger = logging.getLogger("Discord-Bot")
 
-if DISCORD_TOKEN is None:
-    logger.error(" No Discord token found, bot will not start. Please create a .env file with the DISCORD_TOKEN variable.")
-
-
 # Permissions for the bot
 intents = Intents.default()
 intents.messages = True
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!",
-                   intents=intents,
-                   case_insensitive=True,
-                   max_messages=100,
-                   heartbeat_timeout=150.0)
+
+def get_prefix(bot, message):
+    if message.guild is None:
+        return DEFAULT_PREFIX
+    return bot.guild_config.get(message.guild.id).prefix
+
+
+class CogDisabled(commands.CheckFailure):
+    """Command of a cog disabled in the guild. Answered in `on_command_error` without logging a traceback."""
 
 
-@bot.event
-async def on_connect():
-    logger.warning(f" {bot.user} has connected to Discord!\n")
-    for guild in bot.guilds:
-        logger.warning(f" Connected to {guild.name}")
+async def cog_enabled(ctx):
+    """Blocks commands from cogs disabled in the guild."""
+    if ctx.guild is None or ctx.cog is None:
+        return True
+    if ctx.cog.qualified_name in ctx.bot.guild_config.get(ctx.guild.id).disabled_cogs:
+        raise CogDisabled(f"`{ctx.cog.qualified_name}` commands are disabled in this server.")
+    return True
 
-@bot.event
-async def on_ready():
-    """Ready to interact with Discord."""
-    logger.warning(f" {bot.user} has come to repel some bugs 🐛!\n")
-    logger.info(f" Environment variables\nDISCORD_TOKEN: {DISCORD_TOKEN}\nVT_API_KEY: {os.getenv('VT_API_KEY')}\n")
-    await bot.change_presence(activity=discord.Game(name="Bugs may cry🐛🔥"))
 
+def create_bot(guild_config: GuildConfigStore) -> commands.Bot:
+    """The bot with its checks, events and help menu, cogs are loaded by `main`."""
+    bot = commands.Bot(command_prefix=get_prefix,
+                       intents=intents,
+                       case_insensitive=True,
+                       max_messages=100,
+                       heartbeat_timeout=150.0)
+    bot.guild_config = guild_config  # type: ignore
+    bot.add_check(cog_enabled)
 
-# Help Menu
-ending_note = "To list available commands from a specific group, type {help.clean_prefix}{help.invoked_with} <group>. To show a specific command's syntax, type {help.clean_prefix}{help.invoked_with} <command>."
-menu = AppMenu(timeout=120)
-bot.help_command = PrettyHelp(menu=menu, ending_note=ending_note,
-                            show_index=True,
-                            no_category="General",
-                            thumbnail_url="https://play.pokemonshowdown.com/sprites/gen5ani/dugtrio-alola.gif",
-                            index_title="Commands' Groups",
-                            case_insensitive=True,
-                            color=discord.Colour.from_rgb(21, 214, 18))
+    @bot.event
+    async def on_connect():
+        logger.warning(f" {bot.user} has connected to Discord!\n")
+        for guild in bot.guilds:
+            logger.warning(f" Connected to {guild.name}")
+
+    @bot.event
+    async def on_ready():
+        """Ready to interact with Discord."""
+        logger.warning(f" {bot.user} has come to repel some bugs 🐛!\n")
+        logger.info(f" Environment variables\nDISCORD_TOKEN: {os.getenv('DISCORD_TOKEN')}\nVT_API_KEY: {os.getenv('VT_API_KEY')}\n")
+        await bot.change_presence(activity=discord.Game(name="Bugs may cry🐛🔥"))
+
+    @bot.event
+    async def on_command_error(ctx, error):
+        if isinstance(error, CogDisabled):
+            return await ctx.send(str(error))
+        await commands.Bot.on_command_error(bot, ctx, error)  # Default handler, logs the traceback
+
+    # Help Menu
+    ending_note = "To list available commands from a specific group, type {help.clean_prefix}{help.invoked_with} <group>. To show a specific command's syntax, type {help.clean_prefix}{help.invoked_with} <command>."
+    menu = AppMenu(timeout=120)
+    bot.help_command = PrettyHelp(menu=menu, ending_note=ending_note,
+                                show_index=True,
+                                no_category="General",
+                                thumbnail_url="https://play.pokemonshowdown.com/sprites/gen5ani/dugtrio-alola.gif",
+                                index_title="Commands' Groups",
+                                case_insensitive=True,
+                                color=discord.Colour.from_rgb(21, 214, 18))
+    return bot
 
 
 cogs = [
@@ -63,7 +88,8 @@ cogs = [
     "cogs.passwd_commands",
     "cogs.qr_commands",
     "cogs.cli_commands",
-    "cogs.dns_commands"
+    "cogs.dns_commands",
+    "cogs.config_commands"
 ]
 
 async def load_cogs(bot):
@@ -71,10 +97,24 @@ async def load_cogs(bot):
         await bot.load_extension(cog)
 
 async def main():
-    async with bot:
-        bot.add_view(AppNav())
-        await load_cogs(bot)
-        await bot.start(str(DISCORD_TOKEN))
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+    GUILD_CONFIG_DB = os.getenv("GUILD_CONFIG_DB", os.path.join(os.getcwd(), "bot/data/guilds.db"))
+
+    if DISCORD_TOKEN is None:
+        logger.error(" No Discord token found, bot will not start. Please create a .env file with the DISCORD_TOKEN variable.")
+
+    # Guild settings are loaded once, so resolving the prefix of a message is a dict lookup
+    guild_config = GuildConfigStore(GUILD_CONFIG_DB)
+    try:
+        bot = create_bot(guild_config)
+        async with bot:
+            bot.add_view(AppNav())
+            await load_cogs(bot)
+            await bot.start(str(DISCORD_TOKEN))
+    finally:
+        guild_config.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
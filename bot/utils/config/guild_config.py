@@ -0,0 +1,86 @@
+import json
+import sqlite3
+from typing import Any, Optional
+
+DEFAULT_PREFIX = "!"
+DEFAULT_VT_MALICIOUS = 0
+DEFAULT_VT_SUSPICIOUS = 2
+MAX_PREFIX_LEN = 5
+
+
+class GuildConfig:
+    """Settings of a single guild.
+
+    Attributes:
+        `prefix`: Command prefix.
+        `disabled_cogs`: Names of the cogs whose commands are disabled (every cog is enabled by default).
+        `autoscan_channels`: IDs of the channels where posted URLs and IPs are scanned automatically.
+        `vt_malicious`, `vt_suspicious`: A report is flagged when it has more detections than these.
+    """
+    def __init__(self, prefix: str = DEFAULT_PREFIX, disabled_cogs: Optional[set[str]] = None,
+                 autoscan_channels: Optional[set[int]] = None,
+                 vt_malicious: int = DEFAULT_VT_MALICIOUS, vt_suspicious: int = DEFAULT_VT_SUSPICIOUS) -> None:
+        self.prefix = prefix
+        self.disabled_cogs = disabled_cogs or set()
+        self.autoscan_channels = autoscan_channels or set()
+        self.vt_malicious = vt_malicious
+        self.vt_suspicious = vt_suspicious
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "prefix": self.prefix,
+            "disabled_cogs": sorted(self.disabled_cogs),
+            "autoscan_channels": sorted(self.autoscan_channels),
+            "vt_malicious": self.vt_malicious,
+            "vt_suspicious": self.vt_suspicious,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "GuildConfig":
+        return cls(
+            prefix=data.get("prefix", DEFAULT_PREFIX),
+            disabled_cogs=set(data.get("disabled_cogs", [])),
+            autoscan_channels=set(data.get("autoscan_channels", [])),
+            vt_malicious=data.get("vt_malicious", DEFAULT_VT_MALICIOUS),
+            vt_suspicious=data.get("vt_suspicious", DEFAULT_VT_SUSPICIOUS),
+        )
+
+
+class GuildConfigStore:
+    """SQLite-backed guild settings, loaded once and kept in memory.
+
+    Reads never touch the database; every change is written through immediately.
+    """
+    def __init__(self, db_path: str) -> None:
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS guilds (guild_id INTEGER PRIMARY KEY, config TEXT NOT NULL)")
+        self._db.commit()
+        self._default = GuildConfig()
+        self._configs: dict[int, GuildConfig] = {
+            guild_id: GuildConfig.from_dict(json.loads(config))
+            for guild_id, config in self._db.execute("SELECT guild_id, config FROM guilds")
+        }
+
+
+    def get(self, guild_id: Optional[int]) -> GuildConfig:
+        """Settings of the guild, the defaults for DMs or guilds that never changed anything. Don't mutate the result, use `update`."""
+        if guild_id is None:
+            return self._default
+        return self._configs.get(guild_id, self._default)
+
+    def update(self, guild_id: int, **changes: Any) -> GuildConfig:
+        """Change some settings of a guild and persist them."""
+        current = self._configs.get(guild_id) or GuildConfig()
+        config = GuildConfig.from_dict({**current.to_dict(), **changes})
+        self._db.execute("INSERT OR REPLACE INTO guilds (guild_id, config) VALUES (?, ?)", (guild_id, json.dumps(config.to_dict())))
+        self._db.commit()
+        self._configs[guild_id] = config
+        return config
+
+    def reset(self, guild_id: int) -> None:
+        self._db.execute("DELETE FROM guilds WHERE guild_id = ?", (guild_id,))
+        self._db.commit()
+        self._configs.pop(guild_id, None)
+
+    def close(self) -> None:
+        self._db.close()
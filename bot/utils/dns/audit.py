@@ -0,0 +1,256 @@
+import asyncio
+import time
+import dns.asyncquery
+import dns.dnssec
+import dns.exception
+import dns.message
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+import dns.zone
+
+from typing import Optional
+from utils.dns.dnslookup import resolve, query_message
+
+
+AXFR_TIMEOUT = 10
+SPF_MAX_DEPTH = 10
+SPF_LOOKUP_LIMIT = 10   # RFC 7208, more DNS lookups than this is a permerror
+DKIM_SELECTORS = ["default", "dkim", "mail", "selector1", "selector2", "google", "k1", "k2", "s1", "s2",
+                  "smtp", "mx", "email", "mandrill", "everlytickey1", "mxvault", "zoho", "protonmail"]
+
+# DNSSEC statuses
+SECURE = "secure"
+INSECURE = "insecure"
+BOGUS = "bogus"
+UNVALIDATED = "unvalidated"
+
+# The root KSK (KSK-2017), the trust anchor of the whole chain
+ROOT_ANCHORS = ["20326 8 2 E06D44B80B8F1D39A95C0B0D7C65D08458E880409BBB683457104237C7F8EC8D"]
+
+
+async def txt_records(name: str) -> list[str]:
+    """TXT strings of a name, the chunks of every record joined. Empty if there's none or the lookup failed."""
+    try:
+        answer = await resolve(name, "TXT")
+    except dns.exception.DNSException:
+        return []
+    if answer.rrset is None:
+        return []
+    return [b"".join(rdata.strings).decode(errors="replace") for rdata in answer.rrset]
+
+
+async def addresses(name: str) -> list[str]:
+    try:
+        answer = await resolve(name, "A")
+    except dns.exception.DNSException:
+        return []
+    return [rdata.address for rdata in answer.rrset] if answer.rrset is not None else []
+
+
+# ----- Zone transfer -----
+
+async def try_axfr(domain: str, ns: str) -> dict:
+    """Zone transfer from every address of a nameserver. Returns its `status` (`allowed`, `refused` or `unreachable`)."""
+    result = {"ns": ns, "addresses": await addresses(ns), "status": "unreachable", "records": 0}
+    for address in result["addresses"]:
+        zone = dns.zone.Zone(domain)
+        try:
+            await dns.asyncquery.inbound_xfr(address, zone, lifetime=AXFR_TIMEOUT)
+        except dns.exception.Timeout:
+            continue
+        except (dns.exception.DNSException, OSError, EOFError):
+            result["status"] = "refused"
+            continue
+
+        result.update(status="allowed", address=address, records=sum(len(rdataset) for _, rdataset in zone.iterate_rdatasets()))
+        break
+    return result
+
+
+async def audit_axfr(domain: str) -> list[dict]:
+    try:
+        answer = await resolve(domain, "NS")
+    except dns.exception.DNSException:
+        return []
+    if answer.rrset is None:
+        return []
+
+    servers = sorted(rdata.target.to_text().rstrip(".") for rdata in answer.rrset)
+    return list(await asyncio.gather(*(try_axfr(domain, ns) for ns in servers)))
+
+
+# ----- DNSSEC -----
+
+async def _signed_rrset(name: dns.name.Name, rdtype: dns.rdatatype.RdataType) -> tuple[Optional[dns.rrset.RRset], Optional[dns.rrset.RRset]]:
+    """An RRset and its RRSIGs, `(None, None)` if the name has none."""
+    try:
+        response = await query_message(name, rdtype, dnssec=True)
+    except dns.exception.DNSException:
+        return None, None
+
+    rrset = sigs = None
+    for candidate in response.answer:
+        if candidate.name != name:
+            continue
+        if candidate.rdtype == rdtype:
+            rrset = candidate
+        elif candidate.rdtype == dns.rdatatype.RRSIG and candidate.covers == rdtype:
+            sigs = candidate
+    return rrset, sigs
+
+
+def _matches_ds(name: dns.name.Name, keys: dns.rrset.RRset, ds_set) -> bool:
+    for ds in ds_set:
+        for key in keys:
+            try:
+                if dns.dnssec.make_ds(name, key, ds.digest_type) == ds:
+                    return True
+            except (dns.dnssec.UnsupportedAlgorithm, ValueError):
+                continue
+    return False
+
+
+async def audit_dnssec(domain: str) -> dict:
+    """Validates the chain of trust from the root down to `domain`.
+
+    Returns:
+        The `status` (`secure`, `insecure`, `bogus` or `unvalidated` when `cryptography` isn't installed),
+        a `reason` and the `chain` of zones with keys.
+    """
+    name = dns.name.from_text(domain)
+    names = [name]
+    while names[-1] != dns.name.root:
+        names.append(names[-1].parent())
+
+    # Every lookup of the chain at once, most names aren't zone cuts and answer nothing
+    keys, ds_sets = await asyncio.gather(
+        asyncio.gather(*(_signed_rrset(n, dns.rdatatype.DNSKEY) for n in names)),
+        asyncio.gather(*(_signed_rrset(n, dns.rdatatype.DS) for n in names[:-1]))
+    )
+    zones = [(n, k, s, ds) for n, (k, s), ds in zip(names, keys, [*ds_sets, (None, None)]) if k is not None]
+    chain = [zone.to_text() for zone, *_ in zones]
+
+    if not zones or zones[0][0] != name:
+        return {"status": INSECURE, "reason": "The domain has no DNSKEY records", "chain": chain}
+
+    try:
+        for i, (zone, zone_keys, zone_sigs, (ds, ds_sigs)) in enumerate(zones):
+            if zone_sigs is None:
+                return {"status": BOGUS, "reason": f"The DNSKEY of {zone} isn't signed", "chain": chain}
+            dns.dnssec.validate(zone_keys, zone_sigs, {zone: zone_keys})
+
+            if zone == dns.name.root:
+                anchors = [dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.DS, anchor) for anchor in ROOT_ANCHORS]
+                if not _matches_ds(zone, zone_keys, anchors):
+                    return {"status": BOGUS, "reason": "The root keys don't match the trust anchor", "chain": chain}
+                break
+
+            if ds is None:
+                return {"status": INSECURE, "reason": f"No DS record for {zone} in its parent zone", "chain": chain}
+            parent, parent_keys = zones[i + 1][0], zones[i + 1][1]
+            if ds_sigs is None:
+                return {"status": BOGUS, "reason": f"The DS of {zone} isn't signed", "chain": chain}
+            dns.dnssec.validate(ds, ds_sigs, {parent: parent_keys})
+            if not _matches_ds(zone, zone_keys, ds):
+                return {"status": BOGUS, "reason": f"No DNSKEY of {zone} matches its DS", "chain": chain}
+
+    except dns.dnssec.ValidationFailure as e:
+        return {"status": BOGUS, "reason": str(e), "chain": chain}
+    except ImportError:
+        return {"status": UNVALIDATED, "reason": "Signed, but validating needs the cryptography package", "chain": chain}
+    except IndexError:
+        return {"status": BOGUS, "reason": "The chain doesn't reach the root", "chain": chain}
+
+    return {"status": SECURE, "reason": "Valid chain of trust from the root", "chain": chain}
+
+
+# ----- SPF, DMARC and DKIM -----
+
+def spf_record(records: list[str]) -> Optional[str]:
+    spf = [record for record in records if record.lower().startswith("v=spf1")]
+    return spf[0] if len(spf) == 1 else None
+
+
+class SPFExpander:
+    """Expands an SPF record and its `include:`/`redirect=` chain. Every include is looked up once, concurrently,
+    even when several branches share it."""
+    def __init__(self) -> None:
+        self._records: dict[str, asyncio.Task] = {}
+
+    def _record(self, domain: str) -> asyncio.Task:
+        if domain not in self._records:
+            self._records[domain] = asyncio.create_task(txt_records(domain))
+        return self._records[domain]
+
+    async def expand(self, domain: str, path: tuple[str, ...] = ()) -> dict:
+        """Tree of `domain`, `record`, `lookups` (DNS lookups counted by the RFC, including the ones of its
+        includes), `includes` (subtrees) and `error`."""
+        node = {"domain": domain, "record": None, "lookups": 0, "includes": [], "error": None}
+        if domain in path:
+            node["error"] = "include loop"
+            return node
+        if len(path) >= SPF_MAX_DEPTH:
+            node["error"] = "too deep"
+            return node
+
+        record = spf_record(await self._record(domain))
+        if record is None:
+            node["error"] = "no SPF record" if not path else "no single SPF record"
+            return node
+        node["record"] = record
+
+        targets = []
+        for term in record.split()[1:]:
+            mechanism = term.lstrip("+-~?").lower()
+            if mechanism.startswith(("include:", "redirect=")):
+                targets.append(term.split(":" if ":" in term else "=", 1)[1])
+                node["lookups"] += 1
+            elif mechanism.split(":")[0].split("/")[0] in ("a", "mx", "ptr", "exists"):
+                node["lookups"] += 1
+
+        node["includes"] = list(await asyncio.gather(*(self.expand(target, path + (domain,)) for target in targets)))
+        node["lookups"] += sum(child["lookups"] for child in node["includes"])
+        return node
+
+
+def parse_tags(record: str) -> dict[str, str]:
+    tags = {}
+    for part in record.split(";"):
+        key, _, value = part.strip().partition("=")
+        if key:
+            tags[key.strip().lower()] = value.strip()
+    return tags
+
+
+async def audit_dmarc(domain: str) -> Optional[dict]:
+    records = [record for record in await txt_records(f"_dmarc.{domain}") if record.lower().startswith("v=dmarc1")]
+    return parse_tags(records[0]) if records else None
+
+
+async def audit_dkim(domain: str, selectors: list[str] = DKIM_SELECTORS) -> dict[str, dict]:
+    """DKIM keys found under the common selectors (the real ones can't be listed)."""
+    found = await asyncio.gather(*(txt_records(f"{selector}._domainkey.{domain}") for selector in selectors))
+    keys = {}
+    for selector, records in zip(selectors, found):
+        dkim = [record for record in records if "p=" in record]
+        if dkim:
+            keys[selector] = parse_tags(dkim[0])
+    return keys
+
+
+async def audit(domain: str) -> dict:
+    """Zone transfer, DNSSEC, SPF, DMARC and DKIM checks of a domain, all run concurrently.
+
+    Returns:
+        JSON serializable report with the `axfr`, `dnssec`, `spf`, `dmarc` and `dkim` results and the `elapsed` seconds.
+    """
+    start = time.perf_counter()
+    axfr, dnssec, spf, dmarc, dkim = await asyncio.gather(
+        audit_axfr(domain), audit_dnssec(domain), SPFExpander().expand(domain), audit_dmarc(domain), audit_dkim(domain)
+    )
+    return {"domain": domain, "axfr": axfr, "dnssec": dnssec, "spf": spf, "dmarc": dmarc, "dkim": dkim,
+            "elapsed": round(time.perf_counter() - start, 2)}
@@ -0,0 +1,183 @@
+"""Offline benchmark of the DNS subsystem against a local stub server with fault injection.
+
+Run from the `bot` directory:
+    python -m utils.dns.benchmark [--scenario slow] [--count 200] [--concurrency 20] [--upstreams] [--max-p95 250] [--max-error-rate 0.05]
+
+Queries go through the system resolver path by default, `--upstreams` measures the upstream pool (`DNS_UPSTREAMS`) instead.
+
+Exits with code 1 when a p95 latency goes over `--max-p95` milliseconds or the ratio of failed queries (timeouts and
+errors, NXDOMAIN is an answer) goes over `--max-error-rate`, so regressions can be caught in CI.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import dns.exception
+import dns.resolver
+import dns.reversename
+
+from typing import Awaitable, Callable
+from cogs.dns_commands import dns_embed, records_embeds
+from utils.dns import dnslookup
+from utils.embeds import paginator
+from utils.dns.stubserver import StubDNSServer, ZONE
+
+
+# Stub server settings of every scenario
+SCENARIOS = {
+    "clean": {"latency": 0.001},
+    "slow": {"latency": 0.05, "jitter": 0.02},
+    "lossy": {"latency": 0.005, "loss": 0.1},
+    "nxdomain": {"latency": 0.005, "nxdomain": 0.5},
+    "truncated": {"latency": 0.005, "truncate": 0.3},
+}
+QUERY_TIMEOUT = 1  # Lower than the default so lossy scenarios don't take forever
+FAILED = (dnslookup.TIMEOUT_STATUS, dnslookup.ERROR)
+
+
+def percentile(samples: list[float], ratio: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def lookup_statuses(domain: str) -> list[str]:
+    """`dnslookup.lookup`, keeping the status of every record type instead of the records."""
+    _, stats = await dnslookup.lookup_detailed(domain)
+    return [status for status, _ in stats.values()]
+
+
+async def reverse_statuses(ip: str) -> list[str]:
+    """`dnslookup.reverse_lookup`, which leaves failed queries out, keeping the status of every query. Forward lookups
+    that miss the deadline count as timeouts."""
+    try:
+        answers = await dnslookup.resolve(dns.reversename.from_address(ip), "PTR")
+    except dns.resolver.NXDOMAIN:
+        return [dnslookup.NXDOMAIN]
+    except dns.exception.Timeout:
+        return [dnslookup.TIMEOUT_STATUS]
+    except dns.exception.DNSException:
+        return [dnslookup.ERROR]
+
+    names = list(dict.fromkeys(answer.to_text().rstrip(".") for answer in answers))
+    statuses = [dnslookup.OK if names else dnslookup.EMPTY]
+    if not names:
+        return statuses
+    tasks = [asyncio.create_task(lookup_statuses(name)) for name in names]
+    done, pending = await asyncio.wait(tasks, timeout=dnslookup.REVERSE_DEADLINE)
+    for task in pending:
+        task.cancel()
+        statuses.append(dnslookup.TIMEOUT_STATUS)
+    for task in done:
+        statuses.extend(task.result())
+    return statuses
+
+
+async def measure(operation: Callable[[int], Awaitable[list[str]]], count: int, concurrency: int) -> dict:
+    """Runs `operation(i)` `count` times with at most `concurrency` at once. The operation returns the status of every
+    query it made, an exception counts as one failed query. Returns throughput, latency and error stats."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    queries = 0
+    errors = 0
+
+    async def run(i: int) -> None:
+        nonlocal queries, errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                statuses = await operation(i)
+            except Exception:
+                statuses = [dnslookup.ERROR]
+            latencies.append(time.perf_counter() - start)
+            queries += len(statuses)
+            errors += sum(status in FAILED for status in statuses)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    return {
+        "ops/s": count / elapsed,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+        "errors": errors,
+        "error rate": errors / queries if queries else 0.0,
+    }
+
+
+def render(results: dict[str, list[str]]) -> None:
+    """The cog's rendering path: records packed into embeds and grouped in messages."""
+    paginator.group(records_embeds(dns_embed("DNS Lookup Results for bench"), [results]))
+
+
+async def benchmark(scenario: str, count: int, concurrency: int, upstreams: bool = False) -> dict[str, dict]:
+    async with StubDNSServer(seed=1, **SCENARIOS[scenario]) as server:
+        resolver = dnslookup.get_resolver()
+        nameservers, port = resolver.nameservers, resolver.port
+        if upstreams:
+            dnslookup.configure([f"udp://127.0.0.1:{server.port}"], QUERY_TIMEOUT)
+        else:
+            resolver.nameservers, resolver.port = ["127.0.0.1"], server.port
+            dnslookup.configure([], QUERY_TIMEOUT)
+        try:
+            rows = {}
+            # Cold: unique names, every query reaches the server
+            rows["lookup (cold)"] = await measure(lambda i: lookup_statuses(f"host{i}.{ZONE}"), count, concurrency)
+            # Warm: the same names again, answered by the cache
+            rows["lookup (warm)"] = await measure(lambda i: lookup_statuses(f"host{i}.{ZONE}"), count, concurrency)
+            dnslookup.cache.clear()
+            rows["reverse_lookup"] = await measure(lambda i: reverse_statuses(f"10.1.{i // 250}.{i % 250 + 1}"), count, concurrency)
+
+            sample = await dnslookup.lookup(f"render.{ZONE}")
+            start = time.perf_counter()
+            for _ in range(count):
+                render(sample)
+            elapsed = time.perf_counter() - start
+            rows["render"] = {"ops/s": count / elapsed, "p50": elapsed / count * 1000, "p95": elapsed / count * 1000,
+                              "p99": elapsed / count * 1000, "mean": elapsed / count * 1000, "errors": 0, "error rate": 0.0}
+            rows["server"] = server.stats
+            return rows
+
+        finally:
+            await dnslookup.close()
+            dnslookup.configure([], dnslookup.TIMEOUT)
+            resolver.nameservers, resolver.port = nameservers, port
+
+
+def print_table(scenario: str, rows: dict[str, dict]) -> None:
+    server = rows.pop("server")
+    print(f"\n== {scenario} ==  server: {server}")
+    print(f"{'operation':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'err %':>8}")
+    for name, row in rows.items():
+        print(f"{name:<16}{row['ops/s']:>10.1f}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}{row['errors']:>8}{row['error rate']:>8.1%}")
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--count", type=int, default=200, help="Operations per measurement")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--upstreams", action="store_true", help="Resolve through the upstream pool instead of the system resolver")
+    parser.add_argument("--max-p95", type=float, help="Fail when a p95 latency is over this many milliseconds")
+    parser.add_argument("--max-error-rate", type=float, help="Fail when the ratio (0-1) of failed queries of an operation is over this")
+    args = parser.parse_args()
+
+    failed = False
+    for scenario in SCENARIOS if args.scenario == "all" else [args.scenario]:
+        rows = await benchmark(scenario, args.count, args.concurrency, args.upstreams)
+        print_table(scenario, rows)
+        slow = [name for name, row in rows.items() if args.max_p95 is not None and row["p95"] > args.max_p95]
+        if slow:
+            print(f"p95 over {args.max_p95} ms: {', '.join(slow)}")
+            failed = True
+        erroring = [name for name, row in rows.items() if args.max_error_rate is not None and row["error rate"] > args.max_error_rate]
+        if erroring:
+            print(f"Error rate over {args.max_error_rate:.1%}: {', '.join(erroring)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
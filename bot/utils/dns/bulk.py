@@ -0,0 +1,148 @@
+import asyncio
+import csv
+import io
+import json
+import re
+import time
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+from typing import AsyncIterator, Iterable, Optional
+from urllib.parse import urlsplit
+from utils.dns.dnslookup import resolve_uncached, OK, EMPTY, NXDOMAIN, TIMEOUT_STATUS, ERROR
+
+
+BULK_RECORDS = ("A", "AAAA", "CNAME")
+BULK_CONCURRENCY = 50       # Queries in flight for a single job
+MAX_HOSTS = 2000
+MAX_FILE_SIZE = 512 * 1024
+
+SEPARATORS = re.compile(r"[\s,;|]+")
+HOSTNAME = re.compile(r"^(?=.{1,253}$)(?:[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{1,62}$")
+
+# A host takes the status of its most meaningful query, in this order
+STATUS_PRIORITY = [OK, NXDOMAIN, TIMEOUT_STATUS, ERROR, EMPTY]
+
+
+def normalize_host(token: str) -> Optional[str]:
+    """Hostname of a token (plain host, URL or wildcard entry), `None` if it isn't one."""
+    token = token.strip().strip("<>\"'()[]")
+    if "://" in token:
+        token = urlsplit(token).hostname or ""
+    token = token.lower().removeprefix("*.").rstrip(".")
+
+    try:
+        token = token.encode("idna").decode()
+    except UnicodeError:
+        return None
+    return token if HOSTNAME.match(token) else None
+
+
+def parse_hosts(text: str) -> tuple[list[str], list[str]]:
+    """Extracts hostnames from a wordlist or free text. Lines starting with `#` are comments.
+
+    Returns:
+        A tuple with the deduplicated hostnames, in order of appearance, and the rejected tokens.
+    """
+    hosts = {}
+    invalid = []
+    for line in text.splitlines():
+        if line.lstrip().startswith("#"):
+            continue
+        for raw in SEPARATORS.split(line):
+            if not raw:
+                continue
+            host = normalize_host(raw)
+            if host is None:
+                invalid.append(raw)
+            else:
+                hosts[host] = None
+
+    return list(hosts), invalid
+
+
+async def query(host: str, rtype: str, semaphore: asyncio.Semaphore) -> tuple[list[str], str]:
+    """Query one record type of a host, bypassing the answer cache so a big job doesn't flush it. Returns the record
+    values and the status of the query."""
+    async with semaphore:
+        try:
+            answers = await resolve_uncached(host, rtype)
+        except dns.resolver.NXDOMAIN:
+            return [], NXDOMAIN
+        except dns.exception.Timeout:
+            return [], TIMEOUT_STATUS
+        except dns.exception.DNSException:
+            return [], ERROR
+
+    # The answer section also holds the CNAME chain, keep only the asked type
+    rdtype = dns.rdatatype.from_text(rtype)
+    values = [rdata.to_text().rstrip(".") for rrset in answers.response.answer if rrset.rdtype == rdtype for rdata in rrset]
+    return values, OK if values else EMPTY
+
+
+async def resolve_host(host: str, semaphore: asyncio.Semaphore, rtypes: Iterable[str] = BULK_RECORDS) -> dict:
+    """Resolve the record types of a host concurrently.
+
+    Returns:
+        Row with the `host`, its `status`, the values of every record type and the elapsed `ms`.
+    """
+    rtypes = list(rtypes)
+    start = time.perf_counter()
+    answers = await asyncio.gather(*(query(host, rtype, semaphore) for rtype in rtypes))
+    statuses = {status for _, status in answers}
+
+    row = {"host": host, "status": next(status for status in STATUS_PRIORITY if status in statuses)}
+    for rtype, (values, _) in zip(rtypes, answers):
+        row[rtype] = values
+    row["ms"] = round((time.perf_counter() - start) * 1000)
+    return row
+
+
+async def bulk_resolve(hosts: list[str], rtypes: Iterable[str] = BULK_RECORDS,
+                       concurrency: int = BULK_CONCURRENCY) -> AsyncIterator[dict]:
+    """Resolve many hosts with a pool of workers, never more than `concurrency` queries in flight.
+
+    Yields:
+        The rows of `resolve_host` as they complete (not in input order).
+    """
+    rtypes = list(rtypes)
+    pending: asyncio.Queue = asyncio.Queue()
+    for host in hosts:
+        pending.put_nowait(host)
+    done: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker() -> None:
+        while not pending.empty():
+            host = pending.get_nowait()
+            try:
+                row = await resolve_host(host, semaphore, rtypes)
+            except Exception:
+                row = {"host": host, "status": ERROR, **{rtype: [] for rtype in rtypes}, "ms": 0}
+            await done.put(row)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(hosts)))]
+    try:
+        for _ in hosts:
+            yield await done.get()
+
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def rows_to_csv(rows: list[dict], rtypes: Iterable[str] = BULK_RECORDS) -> io.BytesIO:
+    """Builds the CSV attachment, records of the same type are joined with spaces."""
+    rtypes = list(rtypes)
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(["host", "status", *rtypes, "ms"])
+    for row in rows:
+        writer.writerow([row["host"], row["status"], *(" ".join(row[rtype]) for rtype in rtypes), row["ms"]])
+    return io.BytesIO(text.getvalue().encode())
+
+
+def rows_to_json(rows: list[dict]) -> io.BytesIO:
+    return io.BytesIO(json.dumps(rows, indent=2).encode())
@@ -0,0 +1,105 @@
+import time
+import dns.name
+import dns.rdatatype
+import dns.resolver
+from collections import OrderedDict
+from typing import Optional, Union
+
+DEFAULT_MAX_ENTRIES = 4096
+NEGATIVE_TTL = 60       # When an NXDOMAIN carries no SOA
+MAX_TTL = 3600
+
+CacheKey = tuple[dns.name.Name, dns.rdatatype.RdataType]
+
+
+def _nxdomain_ttl(error: dns.resolver.NXDOMAIN) -> float:
+    """Negative TTL of an NXDOMAIN (RFC 2308): the lowest of the SOA TTL and its MINIMUM field."""
+    ttl = None
+    for qname in error.qnames():
+        try:
+            response = error.response(qname)
+        except (KeyError, AttributeError):
+            continue
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                candidate = min(rrset.ttl, rrset[0].minimum)
+                ttl = candidate if ttl is None else min(ttl, candidate)
+    return NEGATIVE_TTL if ttl is None else ttl
+
+
+class DNSCache:
+    """Size-bounded LRU cache of DNS answers that honours their TTLs.
+
+    Empty answers keep the TTL the resolver derived from the SOA and NXDOMAIN errors are cached too (negative caching),
+    so repeated lookups of names that don't exist are answered from memory.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_ttl: float = MAX_TTL) -> None:
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[CacheKey, tuple[float, Union[dns.resolver.Answer, dict]]] = OrderedDict()
+
+
+    @staticmethod
+    def key(qname: Union[dns.name.Name, str], rdtype: Union[dns.rdatatype.RdataType, str]) -> CacheKey:
+        if isinstance(qname, str):
+            qname = dns.name.from_text(qname)
+        return qname.canonicalize(), dns.rdatatype.RdataType.make(rdtype)
+
+    def get(self, key: CacheKey) -> Optional[dns.resolver.Answer]:
+        """Cached answer or `None`.
+
+        Raises:
+            `dns.resolver.NXDOMAIN`: The name is cached as non-existent.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        expires, value = entry
+        if isinstance(value, dict):
+            self.negative_hits += 1
+            raise dns.resolver.NXDOMAIN(**value)
+
+        self.hits += 1
+        return value
+
+    def put(self, key: CacheKey, answer: dns.resolver.Answer) -> None:
+        ttl = min(answer.expiration - time.time(), self.max_ttl)
+        self._store(key, ttl, answer)
+
+    def put_nxdomain(self, key: CacheKey, error: dns.resolver.NXDOMAIN) -> None:
+        ttl = min(_nxdomain_ttl(error), self.max_ttl)
+        self._store(key, ttl, dict(error.kwargs))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        negative = sum(1 for _, value in self._entries.values() if isinstance(value, dict))
+        return {
+            "entries": len(self._entries),
+            "negative_entries": negative,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+    def _store(self, key: CacheKey, ttl: float, value: Union[dns.resolver.Answer, dict]) -> None:
+        if ttl <= 0:
+            return
+
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -1,10 +1,17 @@
+import asyncio
+import time
+import dns.asyncquery
+import dns.asyncresolver
+import dns.message
+import dns.name
 import dns.resolver
 import dns.rdatatype
 import dns.reversename
 import dns.exception
 
-from collections import defaultdict
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
+from utils.dns.cache import DNSCache
+from utils.dns.upstreams import UpstreamPool, parse_upstream
 
 
 RECORDS = [
@@ -18,70 +25,210 @@ RECORDS = [
 ]
 
 
-def lookup(domain: str) -> dict[str, list[str]]:
+TIMEOUT = 5             # Per query
+LOOKUP_DEADLINE = 6     # For all the record types of a lookup
+LOOKUP_CONCURRENCY = 4  # Record types queried at the same time
+REVERSE_DEADLINE = 10   # For all the forward lookups of a reverse lookup
+
+# Status of each record type in `lookup_detailed`
+OK = "ok"
+EMPTY = "empty"
+NXDOMAIN = "nxdomain"
+TIMEOUT_STATUS = "timeout"
+ERROR = "error"
+
+
+# Process-wide resolver (reads /etc/resolv.conf once) and answer cache
+_resolver: Optional[dns.asyncresolver.Resolver] = None
+cache = DNSCache()
+# Custom upstreams, the system resolver is used when there's none
+upstreams: Optional[UpstreamPool] = None
+
+
+def get_resolver() -> dns.asyncresolver.Resolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = dns.asyncresolver.Resolver()
+        _resolver.timeout = TIMEOUT
+        _resolver.lifetime = TIMEOUT
+    return _resolver
+
+
+def configure(specs: list[str], timeout: float = TIMEOUT) -> None:
+    """Resolve through custom upstreams (see `upstreams.parse_upstream`) instead of the system resolver.
+
+    Raises:
+        `ValueError`: An upstream can't be parsed.
     """
-    Perform DNS queries for a given domain and return organized results.
-    
-    Args:
-        domain (str): The domain to query.
-        
-    Returns:
-        Dictionary with record types as keys and lists of records as values.
+    global upstreams
+    get_resolver().timeout = timeout
+    get_resolver().lifetime = timeout
+    upstreams = UpstreamPool([parse_upstream(spec) for spec in specs], timeout) if specs else None
+    cache.clear()
+
+
+async def close() -> None:
+    global upstreams
+    if upstreams is not None:
+        await upstreams.close()
+    upstreams = None
+
+
+async def resolve(qname: Union[dns.name.Name, str], rdtype: Union[dns.rdatatype.RdataType, str]) -> dns.resolver.Answer:
+    """Resolve through the shared answer cache. Like `Resolver.resolve` with `raise_on_no_answer=False`.
+
+    Raises:
+        `dns.resolver.NXDOMAIN`: The name doesn't exist (possibly cached).
+        `dns.exception.DNSException`: The query failed.
     """
-    rs = dns.resolver.Resolver()
-    rs.timeout = 5
-    results = defaultdict(list)
-    
-    for rtype in RECORDS:
+    key = cache.key(qname, rdtype)
+    answer = cache.get(key)
+    if answer is not None:
+        return answer
+
+    try:
+        answer = await resolve_uncached(qname, rdtype)
+    except dns.resolver.NXDOMAIN as e:
+        cache.put_nxdomain(key, e)
+        raise
+
+    cache.put(key, answer)
+    return answer
+
+
+async def resolve_uncached(qname: Union[dns.name.Name, str], rdtype: Union[dns.rdatatype.RdataType, str]) -> dns.resolver.Answer:
+    """`resolve` bypassing the answer cache, for one-off queries (e.g. bulk lookups) that would only evict useful entries.
+
+    Raises:
+        `dns.resolver.NXDOMAIN`: The name doesn't exist.
+        `dns.exception.DNSException`: The query failed.
+    """
+    if upstreams is not None:
+        return await upstreams.resolve(qname, rdtype)
+    return await get_resolver().resolve(qname, rdtype, raise_on_no_answer=False)
+
+
+async def query_message(qname: Union[dns.name.Name, str], rdtype: Union[dns.rdatatype.RdataType, str], dnssec: bool = False) -> dns.message.Message:
+    """Raw response of a query, bypassing the cache. With `dnssec` the RRSIGs are asked too (DO bit).
+
+    Raises:
+        `dns.exception.DNSException`: The query failed.
+    """
+    if isinstance(qname, str):
+        qname = dns.name.from_text(qname)
+    rdtype = dns.rdatatype.RdataType.make(rdtype)
+    if upstreams is not None:
+        return await upstreams.query(qname, rdtype, dnssec)
+
+    resolver = get_resolver()
+    request = dns.message.make_query(qname, rdtype, want_dnssec=dnssec)
+    response, _ = await dns.asyncquery.udp_with_fallback(request, resolver.nameservers[0], timeout=resolver.timeout)
+    return response
+
+
+def _answer_lines(domain: str, answers: dns.resolver.Answer) -> list[str]:
+    lines = []
+    for response in answers.response.answer:
+        for line in response:
+            txt = line.to_text()
+
+            # Remove domain prefix from response
+            if txt.startswith(domain + '.'):
+                txt = txt[len(domain) + 1:].strip()
+            lines.append(txt)
+    return lines
+
+
+async def _resolve_type(domain: str, rtype: dns.rdatatype.RdataType, semaphore: asyncio.Semaphore) -> tuple[list[str], str, float]:
+    """Query one record type. Returns its records, status and elapsed seconds."""
+    async with semaphore:
+        start = time.perf_counter()
         try:
-            type = dns.rdatatype.to_text(rtype)
-            answers = rs.resolve(domain, rtype, raise_on_no_answer=False)
+            answers = await resolve(domain, rtype)
+            records = _answer_lines(domain, answers)
+            return records, OK if records else EMPTY, time.perf_counter() - start
 
-            for response in answers.response.answer:
-                for line in response:
-                    txt = line.to_text() 
+        except dns.resolver.NoAnswer:
+            return [], EMPTY, time.perf_counter() - start
 
-                    # Remove domain prefix from response
-                    if txt.startswith(domain + '.'):
-                        txt = txt[len(domain) + 1:].strip() 
-                    results[type].append(txt)
+        except dns.resolver.NXDOMAIN:
+            return [], NXDOMAIN, time.perf_counter() - start
 
+        except dns.exception.Timeout:
+            return [], TIMEOUT_STATUS, time.perf_counter() - start
 
-        except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, 
-                dns.resolver.NoNameservers, dns.resolver.Timeout):
-            continue
+        except dns.resolver.NoNameservers:
+            return [], ERROR, time.perf_counter() - start
 
         except dns.exception.DNSException as e:
             print(f"Error querying {dns.rdatatype.to_text(rtype)}: {e}")
+            return [], ERROR, time.perf_counter() - start
+
+
+async def lookup_detailed(domain: str, concurrency: int = LOOKUP_CONCURRENCY,
+                          deadline: float = LOOKUP_DEADLINE) -> tuple[dict[str, list[str]], dict[str, tuple[str, float]]]:
+    """
+    Query every record type of `RECORDS` concurrently, with at most `concurrency` queries in flight.
+    Types still unresolved after `deadline` seconds are given up, so the worst case is about one timeout.
+
+    Args:
+        domain (str): The domain to query.
+        concurrency (int): Maximum number of queries in flight.
+        deadline (float): Seconds before giving up the remaining queries.
+
+    Returns:
+        Tuple with the records found (like `lookup`) and, for every record type, its status
+        (`ok`, `empty`, `nxdomain`, `timeout` or `error`) and elapsed seconds.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    tasks = {
+        dns.rdatatype.to_text(rtype): asyncio.create_task(_resolve_type(domain, rtype, semaphore))
+        for rtype in RECORDS
+    }
+    await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results = {}
+    stats = {}
+    for type, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            stats[type] = (TIMEOUT_STATUS, deadline)
             continue
 
-    return dict(results)
+        records, status, elapsed = task.result()
+        stats[type] = (status, elapsed)
+        if records:
+            results[type] = records
 
+    return results, stats
 
-def reverse_lookup(ip: str) -> Optional[list[dict[str, list[str]]]]:
-    """Perform a reverse DNS lookup for a given IP address.
 
+async def lookup(domain: str) -> dict[str, list[str]]:
+    """
+    Perform DNS queries for a given domain and return organized results.
+    Record types are resolved concurrently with `dns.asyncresolver`, see `lookup_detailed`.
+    
     Args:
-        ip (str): The IP address to reverse lookup.
-
+        domain (str): The domain to query.
+        
     Returns:
         Dictionary with record types as keys and lists of records as values.
     """
-    rs = dns.resolver.Resolver()
-    rs.timeout = 5
-    ptr = defaultdict(list)
-    results = []
-    
+    results, _ = await lookup_detailed(domain)
+    return results
+
+
+async def ptr_names(ip: str) -> list[str]:
+    """PTR names of an IP address, without duplicates. Empty if it has none."""
+    names = []
     try:
         reversed = dns.reversename.from_address(ip)
-        answers = rs.resolve(reversed, 'PTR', raise_on_no_answer=False)
+        answers = await resolve(reversed, 'PTR')
         for response in answers:
-            ptr["PTR"].append(response.to_text().rstrip('.'))
-
-        for domain in ptr["PTR"]:
-            results.append(lookup(domain))
-
-        return results
+            name = response.to_text().rstrip('.')
+            if name not in names:
+                names.append(name)
 
     except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN,
             dns.resolver.NoNameservers, dns.resolver.Timeout):
@@ -90,8 +237,57 @@ def reverse_lookup(ip: str) -> Optional[list[dict[str, list[str]]]]:
     except dns.exception.DNSException as e:
         print(f"Error performing reverse lookup for {ip}: {e}")
 
+    return names
+
+
+async def forward_lookups(names: list[str], deadline: float = REVERSE_DEADLINE) -> AsyncIterator[tuple[str, dict[str, list[str]]]]:
+    """Look up several names concurrently (e.g. the PTR names of an IP).
+
+    Args:
+        names (list[str]): Names to look up, duplicates are only looked up once.
+        deadline (float): Seconds before the remaining lookups are given up.
+
+    Yields:
+        `(name, records)` tuples as the lookups complete.
+    """
+    tasks = {asyncio.create_task(lookup(name)): name for name in dict.fromkeys(names)}
+    end = time.monotonic() + deadline
+    pending = set(tasks)
+
+    try:
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield tasks[task], task.result()
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def reverse_lookup(ip: str) -> Optional[list[dict[str, list[str]]]]:
+    """Perform a reverse DNS lookup for a given IP address.
+
+    Args:
+        ip (str): The IP address to reverse lookup.
+
+    Returns:
+        List with a dictionary of records (record types as keys and lists of records as values) for every PTR name,
+        in PTR order. Names whose lookup missed the deadline are left out.
+    """
+    try:
+        names = await ptr_names(ip)
+        completed = {name: records async for name, records in forward_lookups(names)}
+        return [completed[name] for name in names if name in completed]
+
+    except dns.exception.DNSException as e:
+        print(f"Error performing reverse lookup for {ip}: {e}")
+
 
 if __name__ == "__main__":
     ip = "126.4.32.7"
-    result = reverse_lookup(ip)
+    result = asyncio.run(reverse_lookup(ip))
     print(result)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import random
+import struct
+import dns.exception
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+from typing import Optional
+
+
+ZONE = "stub.test"
+TTL = 300
+
+
+class StubDNSServer:
+    """Local DNS server answering every name with made up records, with fault injection to test the DNS subsystem offline.
+
+    Names starting with `nx` don't exist. PTR queries answer `ptr_count` names.
+
+    Args:
+        `latency`, `jitter`: Seconds every response is delayed, plus a random `[0, jitter)`.
+        `loss`: Ratio of UDP queries that are never answered.
+        `nxdomain`: Ratio of queries answered NXDOMAIN on top of the `nx` names.
+        `truncate`: Ratio of UDP responses sent truncated (TC bit, no answer), so the client retries over TCP.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0, jitter: float = 0,
+                 loss: float = 0, nxdomain: float = 0, truncate: float = 0, ptr_count: int = 3, seed: Optional[int] = None) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.nxdomain = nxdomain
+        self.truncate = truncate
+        self.ptr_count = ptr_count
+        self.stats = {"udp": 0, "tcp": 0, "dropped": 0, "truncated": 0, "nxdomain": 0}
+        self._random = random.Random(seed)
+        self._udp: Optional[asyncio.DatagramTransport] = None
+        self._tcp: Optional[asyncio.base_events.Server] = None
+
+
+    async def start(self) -> "StubDNSServer":
+        """Listens on UDP and TCP on the same port (a free one when `port` is 0)."""
+        loop = asyncio.get_running_loop()
+        self._udp, _ = await loop.create_datagram_endpoint(lambda: _UDPProtocol(self), local_addr=(self.host, self.port))
+        self.port = self._udp.get_extra_info("sockname")[1]
+        self._tcp = await asyncio.start_server(self._handle_tcp, self.host, self.port)
+        return self
+
+    async def close(self) -> None:
+        if self._udp is not None:
+            self._udp.close()
+        if self._tcp is not None:
+            self._tcp.close()
+            await self._tcp.wait_closed()
+
+    async def __aenter__(self) -> "StubDNSServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+    def delay(self) -> float:
+        return self.latency + self._random.random() * self.jitter
+
+    def answer(self, wire: bytes, udp: bool) -> Optional[bytes]:
+        """Response to a query, `None` to drop it."""
+        self.stats["udp" if udp else "tcp"] += 1
+        if udp and self._random.random() < self.loss:
+            self.stats["dropped"] += 1
+            return None
+
+        try:
+            query = dns.message.from_wire(wire)
+        except dns.exception.DNSException:
+            return None
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        name, rdtype = question.name, question.rdtype
+
+        if udp and self._random.random() < self.truncate:
+            self.stats["truncated"] += 1
+            response.flags |= dns.flags.TC
+            return response.to_wire()
+
+        if name.labels[0].startswith(b"nx") or self._random.random() < self.nxdomain:
+            self.stats["nxdomain"] += 1
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(dns.rrset.from_text(f"{ZONE}.", TTL, "IN", "SOA", f"ns1.{ZONE}. admin.{ZONE}. 1 3600 600 86400 60"))
+            return response.to_wire()
+
+        records = self._records(name.to_text(), rdtype)
+        if records:
+            response.answer.append(dns.rrset.from_text_list(name, TTL, "IN", rdtype, records))
+        return response.to_wire()
+
+
+    def _records(self, name: str, rdtype: dns.rdatatype.RdataType) -> list[str]:
+        seed = sum(name.encode()) % 250 + 1
+        match rdtype:
+            case dns.rdatatype.A: return [f"10.0.{seed}.1", f"10.0.{seed}.2"]
+            case dns.rdatatype.AAAA: return [f"fd00::{seed:x}"]
+            case dns.rdatatype.MX: return [f"10 mx1.{ZONE}.", f"20 mx2.{ZONE}."]
+            case dns.rdatatype.NS: return [f"ns1.{ZONE}.", f"ns2.{ZONE}."]
+            case dns.rdatatype.TXT: return ['"v=spf1 -all"', f'"stub-verification={seed}"']
+            case dns.rdatatype.SOA: return [f"ns1.{ZONE}. admin.{ZONE}. 1 3600 600 86400 60"]
+            case dns.rdatatype.PTR: return [f"host{i}.{ZONE}." for i in range(self.ptr_count)]
+            case _: return []
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                size, = struct.unpack("!H", await reader.readexactly(2))
+                response = self.answer(await reader.readexactly(size), udp=False)
+                await asyncio.sleep(self.delay())
+                if response is not None:
+                    writer.write(struct.pack("!H", len(response)) + response)
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: StubDNSServer) -> None:
+        self.server = server
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        response = self.server.answer(data, udp=True)
+        if response is not None:
+            asyncio.get_running_loop().call_later(self.server.delay(), self._send, response, addr)
+
+    def _send(self, response: bytes, addr) -> None:
+        if not self.transport.is_closing():
+            self.transport.sendto(response, addr)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+import dns.asyncresolver
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+from hashlib import sha256
+from typing import Optional
+from utils.dns import dnslookup
+from utils.dns.bulk import normalize_host
+from utils.dns.dnslookup import get_resolver, OK
+from utils.dns.upstreams import UpstreamPool
+
+
+BRUTE_CONCURRENCY = 50      # Workers of a single job
+MAX_OUTSTANDING = 100       # Queries in flight across every job, the shared resolver is left alone
+QUERY_TIMEOUT = 2
+WILDCARD_PROBES = 3
+CHECKPOINT_EVERY = 250      # Candidates between two saves of the state file
+MAX_WORDS = 50000
+
+# Shared by every job so several runs can't pile up more than `MAX_OUTSTANDING` queries
+_slots = asyncio.Semaphore(MAX_OUTSTANDING)
+_resolver: Optional[dns.asyncresolver.Resolver] = None
+_pool: Optional[tuple[UpstreamPool, UpstreamPool]] = None  # (configured pool, brute force pool)
+
+
+def brute_resolver() -> dns.asyncresolver.Resolver:
+    """Resolver with short timeouts for brute forcing, it bypasses the answer cache so the misses don't evict useful entries."""
+    global _resolver
+    if _resolver is None:
+        _resolver = dns.asyncresolver.Resolver(configure=False)
+        _resolver.nameservers = get_resolver().nameservers
+        _resolver.timeout = QUERY_TIMEOUT
+        _resolver.lifetime = QUERY_TIMEOUT
+    return _resolver
+
+
+async def brute_resolve(host: str, rdtype: str) -> dns.resolver.Answer:
+    """Like `dnslookup.resolve` without the cache and with short timeouts. Goes through the configured upstreams
+    (`DNS_UPSTREAMS`) when there are some, sharing their connections and health.
+
+    Raises:
+        `dns.resolver.NXDOMAIN`: The host doesn't exist.
+        `dns.exception.DNSException`: The query failed.
+    """
+    global _pool
+    configured = dnslookup.upstreams
+    if configured is None:
+        return await brute_resolver().resolve(host, rdtype, raise_on_no_answer=False)
+
+    if _pool is None or _pool[0] is not configured:
+        _pool = (configured, UpstreamPool(configured.upstreams, QUERY_TIMEOUT, configured.race))
+    return await _pool[1].resolve(host, rdtype)
+
+
+def parse_words(text: str) -> list[str]:
+    """Labels of a wordlist, one per line. Lines starting with `#` are comments."""
+    words = (line.strip().lower().strip(".") for line in text.splitlines())
+    return list(dict.fromkeys(word for word in words if word and not word.startswith("#")))
+
+
+def wordlist_digest(words: list[str]) -> str:
+    return sha256("\n".join(words).encode()).hexdigest()
+
+
+async def _addresses(host: str) -> tuple[list[str], list[str], list[str]]:
+    """A, AAAA and CNAME values of a host, AAAA is only asked when there's no A.
+
+    Raises:
+        `dns.resolver.NXDOMAIN`: The host doesn't exist.
+        `dns.exception.DNSException`: The query failed.
+    """
+    records = {dns.rdatatype.A: [], dns.rdatatype.AAAA: [], dns.rdatatype.CNAME: []}
+
+    async with _slots:
+        answer = await brute_resolve(host, "A")
+        if answer.rrset is None:
+            answer = await brute_resolve(host, "AAAA")
+
+    for rrset in answer.response.answer:
+        if rrset.rdtype in records:
+            records[rrset.rdtype].extend(rdata.to_text().rstrip(".") for rdata in rrset)
+    return records[dns.rdatatype.A], records[dns.rdatatype.AAAA], records[dns.rdatatype.CNAME]
+
+
+async def detect_wildcard(domain: str, probes: int = WILDCARD_PROBES) -> set[str]:
+    """Resolves random labels under `domain`. Returns the values they resolve to, empty if there's no wildcard."""
+    values = set()
+    for _ in range(probes):
+        try:
+            a, aaaa, cname = await _addresses(f"{secrets.token_hex(8)}.{domain}")
+            values.update(a, aaaa, cname)
+        except dns.exception.DNSException:
+            pass
+    return values
+
+
+class SubBrute:
+    """Brute forces the subdomains of a domain from a wordlist.
+
+    Progress is saved to `state_path` every `CHECKPOINT_EVERY` candidates and when the run is stopped, a new run with
+    the same domain and wordlist resumes from there. Hosts that resolve only to what random labels resolve to
+    (wildcard DNS) are dropped.
+
+    Attributes:
+        `found`: Rows like the ones of `bulk.resolve_host`.
+        `position`: Every candidate before it has been tried.
+        `done`: Candidates tried, including the ones of a resumed run.
+    """
+    def __init__(self, domain: str, words: list[str], state_path: str, concurrency: int = BRUTE_CONCURRENCY) -> None:
+        self.domain = domain
+        self.words = words
+        self.state_path = state_path
+        self.concurrency = concurrency
+        self.digest = wordlist_digest(words)
+        self.found: list[dict] = []
+        self.wildcard: set[str] = set()
+        self.position = 0
+        self.done = 0
+        self.errors = 0
+        self.suppressed = 0
+        self.resumed = False
+        self.started = time.monotonic()
+        self._stopping = False
+        self._load()
+
+
+    @property
+    def total(self) -> int:
+        return len(self.words)
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= self.total
+
+    def stop(self) -> None:
+        """Workers finish their current query and the progress is saved."""
+        self._stopping = True
+
+
+    async def run(self) -> list[dict]:
+        if not self.resumed:
+            self.wildcard = await detect_wildcard(self.domain)
+
+        completed = bytearray(self.total)
+        known = {row["host"] for row in self.found}
+        next_index = self.position
+
+        async def worker() -> None:
+            nonlocal next_index
+            while not self._stopping and next_index < self.total:
+                index = next_index
+                next_index += 1
+                row = await self._probe(self.words[index])
+                # A resumed run tries again what was past `position`, some of it may be known already
+                if row is not None and row["host"] not in known:
+                    known.add(row["host"])
+                    self.found.append(row)
+
+                completed[index] = 1
+                self.done += 1
+                while self.position < self.total and completed[self.position]:
+                    self.position += 1
+                if self.done % CHECKPOINT_EVERY == 0:
+                    self._save()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            self._save()
+
+        return self.found
+
+
+    async def _probe(self, word: str) -> Optional[dict]:
+        host = normalize_host(f"{word}.{self.domain}")
+        if host is None:
+            return None
+
+        start = time.perf_counter()
+        try:
+            a, aaaa, cname = await _addresses(host)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return None
+        except dns.exception.DNSException:
+            self.errors += 1
+            return None
+
+        # The CNAMEs count too, the wildcard may be one. A host answering nothing is never a wildcard hit
+        values = set(a) | set(aaaa) | set(cname)
+        if not values:
+            return None
+        if self.wildcard and values <= self.wildcard:
+            self.suppressed += 1
+            return None
+
+        return {"host": host, "status": OK, "A": a, "AAAA": aaaa, "CNAME": cname, "ms": round((time.perf_counter() - start) * 1000)}
+
+
+    def _load(self) -> None:
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if state.get("domain") != self.domain or state.get("wordlist") != self.digest:
+            return
+        self.position = self.done = state["position"]
+        self.found = state["found"]
+        self.wildcard = set(state["wildcard"])
+        self.resumed = True
+
+    def _save(self) -> None:
+        if self.finished:
+            # Nothing left to resume
+            try:
+                os.remove(self.state_path)
+            except FileNotFoundError:
+                pass
+            return
+
+        state = {"domain": self.domain, "wordlist": self.digest, "position": self.position,
+                 "found": self.found, "wildcard": sorted(self.wildcard)}
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp = self.state_path + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(state, file)
+        os.replace(temp, self.state_path)
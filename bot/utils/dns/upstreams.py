@@ -0,0 +1,325 @@
+import asyncio
+import random
+import ssl
+import struct
+import time
+import aiohttp
+import dns.asyncquery
+import dns.exception
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+from typing import Optional, Union
+from urllib.parse import urlsplit
+
+
+RACE = 2                # Upstreams queried at the same time, the first answer wins
+EWMA_ALPHA = 0.3
+INITIAL_LATENCY = 0.05  # Seconds, so upstreams without samples get a chance
+MAX_BACKOFF = 60        # Seconds an upstream that keeps failing is left out
+
+
+class UpstreamError(dns.exception.DNSException):
+    """An upstream answered with SERVFAIL, REFUSED or something unusable."""
+
+
+class Health:
+    """Latency (EWMA) and failures of an upstream. Upstreams failing in a row are skipped for an exponential backoff."""
+    def __init__(self) -> None:
+        self.latency = INITIAL_LATENCY
+        self.queries = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def observe(self, elapsed: float) -> None:
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+
+    def success(self, elapsed: float) -> None:
+        self.queries += 1
+        self.consecutive_failures = 0
+        self.observe(elapsed)
+
+    def failure(self, elapsed: float) -> None:
+        self.queries += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.observe(elapsed)
+        if self.consecutive_failures >= 3:
+            self.down_until = time.monotonic() + min(2 ** (self.consecutive_failures - 3), MAX_BACKOFF)
+
+    @property
+    def up(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def score(self) -> float:
+        """Lower is better."""
+        return self.latency * (1 + self.consecutive_failures)
+
+
+class Upstream:
+    """A nameserver and the transport to reach it. Subclasses implement `_exchange`."""
+    transport = "udp"
+
+    def __init__(self, address: str, port: int) -> None:
+        self.address = address
+        self.port = port
+        self.health = Health()
+
+    @property
+    def name(self) -> str:
+        return f"{self.transport}://{self.address}:{self.port}"
+
+    async def query(self, qname: dns.name.Name, rdtype: dns.rdatatype.RdataType, timeout: float, dnssec: bool = False) -> dns.message.Message:
+        """Send a query and update the health of the upstream. With `dnssec` the RRSIGs are asked too (DO bit).
+
+        Raises:
+            `UpstreamError`: The upstream answered with an error other than NXDOMAIN.
+            `asyncio.TimeoutError`, `OSError`, `aiohttp.ClientError`, `dns.exception.DNSException`: The query failed.
+        """
+        request = dns.message.make_query(qname, rdtype, want_dnssec=dnssec)
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._exchange(request, timeout), timeout)
+            if response.rcode() not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+                raise UpstreamError(f"{self.name} answered {dns.rcode.to_text(response.rcode())}")
+
+        except asyncio.CancelledError:
+            # Lost a race, how long it took so far is still a hint of its latency
+            self.health.observe(time.monotonic() - start)
+            raise
+
+        except (asyncio.TimeoutError, OSError, aiohttp.ClientError, dns.exception.DNSException):
+            self.health.failure(time.monotonic() - start)
+            raise
+
+        self.health.success(time.monotonic() - start)
+        return response
+
+    async def close(self) -> None:
+        pass
+
+    async def _exchange(self, request: dns.message.Message, timeout: float) -> dns.message.Message:
+        response, _ = await dns.asyncquery.udp_with_fallback(request, self.address, timeout=timeout, port=self.port)
+        return response
+
+
+class TLSUpstream(Upstream):
+    """DNS over TLS (RFC 7858) on a persistent connection. Queries are pipelined and matched to responses by ID."""
+    transport = "tls"
+
+    def __init__(self, address: str, port: int = 853, server_hostname: Optional[str] = None) -> None:
+        super().__init__(address, port)
+        self.server_hostname = server_hostname or address
+        self._ssl = ssl.create_default_context()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_connection(self.address, self.port, ssl=self._ssl, server_hostname=self.server_hostname)
+                self._pending = {}
+                self._reader_task = asyncio.create_task(self._read_responses(reader, self._writer, self._pending))
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, pending: dict[int, asyncio.Future]) -> None:
+        error: Exception = ConnectionError(f"{self.name} closed the connection")
+        try:
+            while True:
+                size, = struct.unpack("!H", await reader.readexactly(2))
+                response = dns.message.from_wire(await reader.readexactly(size))
+                future = pending.get(response.id)
+                if future is not None and not future.done():
+                    future.set_result(response)
+
+        except (OSError, asyncio.IncompleteReadError, dns.exception.DNSException) as e:
+            error = ConnectionError(f"{self.name}: {e}")
+
+        finally:
+            # Whatever was waiting on this connection has to be retried on a new one
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _exchange(self, request: dns.message.Message, timeout: float) -> dns.message.Message:
+        reused = self._writer is not None and not self._writer.is_closing()
+        try:
+            return await self._send(request)
+        except ConnectionError:
+            # Servers drop idle connections, that's no reason to fail the query
+            if not reused:
+                raise
+            return await self._send(request)
+
+    async def _send(self, request: dns.message.Message) -> dns.message.Message:
+        writer = await self._connect()
+        pending = self._pending
+        while request.id in pending:
+            request.id = random.randint(0, 0xFFFF)
+
+        future = asyncio.get_running_loop().create_future()
+        pending[request.id] = future
+        try:
+            wire = request.to_wire()
+            writer.write(struct.pack("!H", len(wire)) + wire)
+            await writer.drain()
+            response = await future
+        finally:
+            del pending[request.id]
+
+        if not request.is_response(response):
+            raise UpstreamError(f"{self.name} sent a response that doesn't match the query")
+        return response
+
+
+class HTTPSUpstream(Upstream):
+    """DNS over HTTPS (RFC 8484) with POST requests on a keep-alive session."""
+    transport = "https"
+
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        super().__init__(parts.hostname, parts.port or 443)
+        self.url = url
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def name(self) -> str:
+        return self.url
+
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=10, ttl_dns_cache=300, keepalive_timeout=60))
+        return self._session
+
+    async def _exchange(self, request: dns.message.Message, timeout: float) -> dns.message.Message:
+        request.id = 0  # Recommended by the RFC, helps HTTP caches
+        headers = {"Content-Type": "application/dns-message", "Accept": "application/dns-message"}
+        async with self._get_session().post(self.url, data=request.to_wire(), headers=headers) as response:
+            response.raise_for_status()
+            wire = await response.read()
+
+        answer = dns.message.from_wire(wire)
+        if not request.is_response(answer):
+            raise UpstreamError(f"{self.name} sent a response that doesn't match the query")
+        return answer
+
+
+def parse_upstream(spec: str) -> Upstream:
+    """Builds an upstream from `1.1.1.1`, `udp://1.1.1.1:53`, `tls://1.1.1.1#cloudflare-dns.com` (the fragment is the
+    TLS server name) or `https://cloudflare-dns.com/dns-query`.
+
+    Raises:
+        `ValueError`: Unknown scheme or missing address.
+    """
+    spec = spec.strip()
+    if "://" not in spec:
+        return Upstream(spec, 53)
+
+    parts = urlsplit(spec)
+    if not parts.hostname:
+        raise ValueError(f"Missing address in upstream {spec!r}")
+    match parts.scheme.lower():
+        case "udp": return Upstream(parts.hostname, parts.port or 53)
+        case "tls": return TLSUpstream(parts.hostname, parts.port or 853, parts.fragment or None)
+        case "https": return HTTPSUpstream(spec)
+        case _: raise ValueError(f"Unknown upstream scheme {parts.scheme!r}")
+
+
+class UpstreamPool:
+    """Resolves through a list of upstreams, racing the `RACE` healthiest and falling back to the rest."""
+    def __init__(self, upstreams: list[Upstream], timeout: float, race: int = RACE) -> None:
+        if not upstreams:
+            raise ValueError("At least one upstream is needed")
+        self.upstreams = upstreams
+        self.timeout = timeout
+        self.race = race
+
+
+    def ranked(self) -> list[Upstream]:
+        """Upstreams by score, the ones in backoff last."""
+        return sorted(self.upstreams, key=lambda upstream: (not upstream.health.up, upstream.health.score()))
+
+    async def query(self, qname: dns.name.Name, rdtype: dns.rdatatype.RdataType, dnssec: bool = False) -> dns.message.Message:
+        """First usable response of the raced upstreams. When one fails, the next one in the ranking takes its place.
+
+        Raises:
+            `dns.exception.Timeout`: Every upstream timed out.
+            `dns.resolver.NoNameservers`: Every upstream failed.
+        """
+        waiting = self.ranked()
+        tasks: dict[asyncio.Task, Upstream] = {}
+        errors = []
+
+        def launch() -> None:
+            upstream = waiting.pop(0)
+            tasks[asyncio.create_task(upstream.query(qname, rdtype, self.timeout, dnssec))] = upstream
+
+        for _ in range(min(self.race, len(waiting))):
+            launch()
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    upstream = tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append((upstream.name, upstream.transport != "udp", upstream.port, task.exception(), None))
+                    if waiting:
+                        launch()
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if all(isinstance(error, asyncio.TimeoutError) for _, _, _, error, _ in errors):
+            raise dns.exception.Timeout(timeout=self.timeout)
+        raise dns.resolver.NoNameservers(request=dns.message.make_query(qname, rdtype), errors=errors)
+
+    async def resolve(self, qname: Union[dns.name.Name, str], rdtype: Union[dns.rdatatype.RdataType, str]) -> dns.resolver.Answer:
+        """Like `Resolver.resolve` with `raise_on_no_answer=False`.
+
+        Raises:
+            `dns.resolver.NXDOMAIN`: The name doesn't exist, the response is attached for negative caching.
+        """
+        if isinstance(qname, str):
+            qname = dns.name.from_text(qname)
+        rdtype = dns.rdatatype.RdataType.make(rdtype)
+
+        response = await self.query(qname, rdtype)
+        if response.rcode() == dns.rcode.NXDOMAIN:
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+        return dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response)
+
+    def stats(self) -> list[dict]:
+        return [
+            {"name": upstream.name, "latency_ms": round(upstream.health.latency * 1000), "queries": upstream.health.queries,
+             "failures": upstream.health.failures, "up": upstream.health.up}
+            for upstream in self.ranked()
+        ]
+
+    async def close(self) -> None:
+        await asyncio.gather(*(upstream.close() for upstream in self.upstreams), return_exceptions=True)
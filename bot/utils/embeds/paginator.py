@@ -0,0 +1,190 @@
+import discord
+from typing import Iterable, Optional
+
+
+# Discord limits
+MAX_FIELDS = 25
+MAX_FIELD_NAME = 256
+MAX_FIELD_VALUE = 1024
+MAX_DESCRIPTION = 4096
+MAX_EMBED_CHARS = 6000          # Per message, shared by all of its embeds
+MAX_EMBEDS_PER_MESSAGE = 10
+
+INLINE_MESSAGES = 2             # More messages than this and the result is paginated with buttons instead
+PAGINATOR_TIMEOUT = 300
+
+Field = tuple[str, str]
+
+
+def split_field(name: str, value: str, code: bool = False) -> list[Field]:
+    """Splits a value into as many fields as needed, cutting on line breaks when possible.
+
+    Args:
+        `code`: Wrap every part in a code block.
+    """
+    wrapper = 8 if code else 0  # ```\n ... \n```
+    limit = MAX_FIELD_VALUE - wrapper
+    name = name[:MAX_FIELD_NAME]
+
+    parts = []
+    current = ""
+    for line in value.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current or not parts:
+        parts.append(current)
+
+    return [(name, f"```\n{part}\n```" if code else part or "\u200b") for part in parts]
+
+
+def pack(fields: Iterable[Field], template: discord.Embed) -> list[discord.Embed]:
+    """Packs fields into as few embeds as fit Discord's limits.
+
+    Every embed is a copy of `template` (colour, footer, author...), only the first one keeps its title and description.
+    Fields longer than the limits must be split with `split_field` first.
+    """
+    def new_embed(first: bool) -> discord.Embed:
+        embed = template.copy()
+        embed.clear_fields()
+        if not first:
+            embed.title = None
+            embed.description = None
+        return embed
+
+    embed = new_embed(True)
+    embeds = [embed]
+    for name, value in fields:
+        if len(embed.fields) >= MAX_FIELDS or len(embed) + len(name) + len(value) > MAX_EMBED_CHARS:
+            embed = new_embed(False)
+            embeds.append(embed)
+        embed.add_field(name=name, value=value, inline=False)
+    return embeds
+
+
+def paginate_lines(lines: list[str], template: discord.Embed) -> list[discord.Embed]:
+    """Spreads lines over the descriptions of as few embeds as possible, the title is repeated on every one."""
+    budget = min(MAX_DESCRIPTION, MAX_EMBED_CHARS - len(template) + len(template.description or ""))
+    embeds = []
+    current: list[str] = []
+    size = 0
+    for line in lines:
+        line = line[:budget]
+        if current and size + len(line) + 1 > budget:
+            embeds.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    embeds.append(current)
+
+    pages = []
+    for page in embeds:
+        embed = template.copy()
+        embed.description = "\n".join(page)
+        pages.append(embed)
+    return pages
+
+
+def group(embeds: list[discord.Embed]) -> list[list[discord.Embed]]:
+    """Groups embeds in messages, up to 10 and 6000 characters each."""
+    messages: list[list[discord.Embed]] = [[]]
+    size = 0
+    for embed in embeds:
+        current = messages[-1]
+        if current and (len(current) >= MAX_EMBEDS_PER_MESSAGE or size + len(embed) > MAX_EMBED_CHARS):
+            current = []
+            messages.append(current)
+            size = 0
+        current.append(embed)
+        size += len(embed)
+    return messages
+
+
+class Paginator(discord.ui.View):
+    """Shows one page (a group of embeds) at a time with buttons, only the pages that are looked at are ever sent."""
+    def __init__(self, pages: list[list[discord.Embed]], author_id: Optional[int] = None, timeout: float = PAGINATOR_TIMEOUT) -> None:
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.author_id = author_id
+        self.index = 0
+        self.message: Optional[discord.Message] = None
+        self._update_buttons()
+
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.author_id is not None and interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only who ran the command can turn the pages folk.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self) -> None:
+        for item in self.children:
+            item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.index - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def counter(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        pass
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.index + 1)
+
+
+    def _update_buttons(self) -> None:
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.index >= len(self.pages) - 1
+        self.counter.label = f"{self.index + 1}/{len(self.pages)}"
+
+    async def _show(self, interaction: discord.Interaction, index: int) -> None:
+        self.index = max(0, min(index, len(self.pages) - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(embeds=self.pages[self.index], view=self)
+
+
+async def send(destination: discord.abc.Messageable, embeds: list[discord.Embed], author_id: Optional[int] = None, **kwargs) -> discord.Message:
+    """Sends embeds in as few messages as possible, or paginated with buttons when they'd take too many.
+
+    Extra keyword arguments (e.g. `file`) go to the first message. Returns that message.
+    """
+    messages = group(embeds)
+    if len(messages) > INLINE_MESSAGES:
+        view = Paginator(messages, author_id)
+        view.message = await destination.send(embeds=messages[0], view=view, **kwargs)
+        return view.message
+
+    first = await destination.send(embeds=messages[0], **kwargs)
+    for message in messages[1:]:
+        await destination.send(embeds=message)
+    return first
+
+
+async def edit(message: discord.Message, embeds: list[discord.Embed], author_id: Optional[int] = None, **kwargs) -> discord.Message:
+    """Like `send`, replacing the content of an existing message (e.g. a progress message) with the first page."""
+    messages = group(embeds)
+    if len(messages) > INLINE_MESSAGES:
+        view = Paginator(messages, author_id)
+        view.message = await message.edit(embeds=messages[0], view=view, **kwargs)
+        return view.message
+
+    edited = await message.edit(embeds=messages[0], **kwargs)
+    for page in messages[1:]:
+        await message.channel.send(embeds=page)
+    return edited
@@ -0,0 +1,110 @@
+import asyncio
+import csv
+import io
+import re
+import zipfile
+
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+MAX_FILE_SIZE = 256 * 1024
+MAX_CODES = 500
+MAX_PAYLOAD_BYTES = 64 * 1024   # All the payloads together
+MAX_CODE_BYTES = 1273           # Most a QR holds with 30% error correction (version 40)
+UPLOAD_LIMIT = 10 * 1024 * 1024 # Attachment limit where there's no guild to ask (DMs)
+INDEX_RESERVE = 128 * 1024      # Room kept for the index.csv and the ZIP directory
+
+UNSAFE_NAME = re.compile(r"[^\w.-]+")
+
+
+def parse_payloads(text: str, columns: bool = False) -> list[tuple[str, str]]:
+    """`(name, payload)` of every non-empty line, names are numbered. With `columns` (CSV files), rows with two
+    columns are `name,payload`.
+
+    Raises:
+        `ValueError`: Too many codes, too much data or a payload that doesn't fit in a QR.
+    """
+    if columns:
+        rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+        entries = [(row[0], row[1]) if len(row) >= 2 else ("", row[0]) for row in rows if row and any(row)]
+        if entries and [cell.lower() for cell in entries[0]] == ["name", "payload"]:
+            entries = entries[1:]
+        entries = [(name, payload) for name, payload in entries if payload]
+    else:
+        entries = [("", line.strip()) for line in text.splitlines() if line.strip()]
+
+    if len(entries) > MAX_CODES:
+        raise ValueError(f"Too many codes ({len(entries)}), the limit is {MAX_CODES} per batch")
+    if sum(len(payload.encode()) for _, payload in entries) > MAX_PAYLOAD_BYTES:
+        raise ValueError(f"Too much data, the limit is {MAX_PAYLOAD_BYTES // 1024} KB of payloads per batch")
+    for i, (_, payload) in enumerate(entries, 1):
+        if len(payload.encode()) > MAX_CODE_BYTES:
+            raise ValueError(f"Entry {i} is too long for a QR (max {MAX_CODE_BYTES} bytes)")
+
+    names = set()
+    named = []
+    for i, (name, payload) in enumerate(entries, 1):
+        name = UNSAFE_NAME.sub("_", name).strip("._")[:64] or f"qr_{i:03}"
+        if name in names:
+            name = f"{name}_{i:03}"
+        names.add(name)
+        named.append((name, payload))
+    return named
+
+
+async def render_batch(entries: list[tuple[str, str]], render: Callable[[str], Awaitable[bytes]],
+                       concurrency: int) -> AsyncIterator[tuple[str, str, Optional[bytes], Optional[str]]]:
+    """Renders every payload with `concurrency` renders at once. Yields `(name, payload, image, error)` as they finish."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for entry in entries:
+        queue.put_nowait(entry)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker() -> None:
+        while not queue.empty():
+            name, payload = queue.get_nowait()
+            try:
+                await results.put((name, payload, await render(payload), None))
+            except Exception as e:
+                await results.put((name, payload, None, str(e) or type(e).__name__))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(entries)))]
+    try:
+        for _ in range(len(entries)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+class BatchZip:
+    """ZIP archive written as codes come in, with an `index.csv` of every file, its payload and its error, if any.
+
+    PNGs and WebPs are stored as they are, they are compressed already.
+    """
+    def __init__(self, format: str) -> None:
+        self.format = format
+        self.buffer = io.BytesIO()
+        self.rows: list[tuple[str, str, str, str]] = []
+        self._zip = zipfile.ZipFile(self.buffer, "w", compression=zipfile.ZIP_DEFLATED if format == "svg" else zipfile.ZIP_STORED)
+
+    @property
+    def size(self) -> int:
+        """Bytes written so far."""
+        return self.buffer.tell()
+
+    def add(self, name: str, payload: str, image: Optional[bytes], error: Optional[str]) -> None:
+        filename = f"{name}.{self.format}"
+        if image is not None:
+            self._zip.writestr(filename, image)
+        self.rows.append((name, filename if image is not None else "", payload, error or ""))
+
+    def close(self) -> io.BytesIO:
+        index = io.StringIO()
+        writer = csv.writer(index)
+        writer.writerow(["file", "payload", "error"])
+        writer.writerows(row[1:] for row in sorted(self.rows))
+        self._zip.writestr("index.csv", index.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+        self._zip.close()
+        self.buffer.seek(0)
+        return self.buffer
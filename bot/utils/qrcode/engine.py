@@ -0,0 +1,113 @@
+import base64
+import io
+import qrcode
+import qrcode.image.svg
+import xml.etree.ElementTree as ET
+
+from qrcode.constants import ERROR_CORRECT_H
+from PIL import Image
+from typing import Optional
+
+VERSION = 4
+BOX_SIZE = 10
+BORDER = 2
+
+# Output formats and their MIME types
+FORMATS = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
+DEFAULT_FORMAT = "png"
+
+
+def new_qr(**kwargs) -> qrcode.QRCode:
+    return qrcode.QRCode(
+        version=VERSION,
+        error_correction=ERROR_CORRECT_H, # 30% error correction
+        box_size=BOX_SIZE,
+        border=BORDER,
+        **kwargs,
+    )
+
+
+def logo_width(data: str) -> int:
+    """Side of the box the logo of a QR of `data` is fitted in (25% of the QR), worked out without rendering it."""
+    qr = new_qr()
+    qr.add_data(data)
+    version = qr.best_fit(start=VERSION)
+    return (version * 4 + 17 + 2 * BORDER) * BOX_SIZE // 4
+
+
+def fit_size(size: tuple[int, int], box: int) -> tuple[int, int]:
+    """`size` scaled to fit in a `box` x `box` square, keeping the aspect ratio. Bounds both sides, so a 1 pixel
+    wide strip can't be scaled up to a gigantic height."""
+    scale = box / max(size)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def paste_logo(img: Image.Image, logo: bytes) -> None:
+    """Pastes a logo (PNG bytes from the `LogoFetcher`, already resized) in the center of the QR."""
+    logo_img = Image.open(io.BytesIO(logo))
+    size = fit_size(logo_img.size, img.size[0] // 4)  # 25%
+    if logo_img.size != size:
+        logo_img = logo_img.resize(size, Image.Resampling.LANCZOS)
+
+    center = ((img.size[0] - logo_img.size[0]) // 2, (img.size[1] - logo_img.size[1]) // 2)
+    img.paste(logo_img, center, mask=logo_img)
+
+
+def _svg(data: str, logo: Optional[bytes]) -> bytes:
+    qr = new_qr(image_factory=qrcode.image.svg.SvgPathFillImage)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image()
+
+    if logo:
+        size = img.pixel_size
+        width, height = fit_size(Image.open(io.BytesIO(logo)).size, size // 4)
+        img._img.append(ET.Element(
+            "image",
+            href="data:image/png;base64," + base64.b64encode(logo).decode(),
+            x=str(img.units((size - width) // 2, text=False)),
+            y=str(img.units((size - height) // 2, text=False)),
+            width=str(img.units(width, text=False)),
+            height=str(img.units(height, text=False)),
+        ))
+
+    output = io.BytesIO()
+    img.save(output)
+    return output.getvalue()
+
+
+def render(data: str, logo: Optional[bytes] = None, format: str = DEFAULT_FORMAT) -> io.BytesIO:
+    """
+    Renders a QR code of `data`.
+
+    Args:
+        `data`: The data to encode in the QR code.
+        `logo`: PNG of the logo to insert in the center of the QR.
+        `format`: One of `FORMATS`. PNGs without logo are 1-bit, WebPs are lossless.
+
+    Returns:
+        `io.BytesIO`: A BytesIO object containing the generated QR code.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown QR format: {format}")
+
+    if format == "svg":
+        return io.BytesIO(_svg(data, logo))
+
+    qr = new_qr()
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").get_image() # type: ignore
+
+    # Without a logo the image stays 1-bit, no RGB conversion needed
+    if logo:
+        img = img.convert("RGB")
+        paste_logo(img, logo)
+
+    output = io.BytesIO()
+    if format == "png":
+        img.save(output, format="PNG", optimize=img.mode == "1")  # Cheap on 1-bit images, slow on RGB ones
+    else:
+        img.save(output, format="WEBP", lossless=True, quality=100, method=4)
+    output.seek(0)
+    return output
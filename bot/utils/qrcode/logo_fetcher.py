@@ -0,0 +1,133 @@
+import asyncio
+import io
+import aiohttp
+from collections import OrderedDict
+from PIL import Image
+from typing import Optional
+from utils.qrcode.engine import fit_size
+
+MAX_BYTES = 2 * 1024 * 1024     # Downloads are aborted past this
+MAX_PIXELS = 4096 * 4096        # Decompression bomb guard, checked before decoding
+MAX_ASPECT = 32                 # Longest side over the shortest one, no logo is a 1 pixel strip
+CACHE_ENTRIES = 128
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+CHUNK_SIZE = 64 * 1024
+
+
+def prepare_logo(data: bytes, width: int) -> bytes:
+    """Decodes a logo and resizes it to fit in a `width` x `width` box (keeping the aspect ratio). Returns it as RGBA PNG bytes.
+
+    Raises:
+        `ValueError`: Not an image, too many pixels or too narrow.
+    """
+    try:
+        logo = Image.open(io.BytesIO(data))
+        # Only the header has been read so far
+        if logo.size[0] * logo.size[1] > MAX_PIXELS:
+            raise ValueError(f"Image too large ({logo.size[0]}x{logo.size[1]})")
+        if max(logo.size) > MAX_ASPECT * max(1, min(logo.size)):
+            raise ValueError(f"Image too narrow ({logo.size[0]}x{logo.size[1]})")
+        logo.draft("RGBA", (width, width))  # JPEGs are decoded already downscaled
+        logo = logo.convert("RGBA")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Failed to open the image from the URL.") from e
+
+    logo = logo.resize(fit_size(logo.size, width), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    logo.save(output, format="PNG")
+    return output.getvalue()
+
+
+class LogoFetcher:
+    """Downloads QR logos on a shared aiohttp session and keeps them decoded and resized in an LRU cache.
+
+    Entries are keyed by URL and width, so a popular logo is downloaded and resized once. Concurrent requests of the
+    same logo share the download.
+    """
+    def __init__(self, max_bytes: int = MAX_BYTES, max_entries: int = CACHE_ENTRIES) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple[str, int], bytes] = OrderedDict()
+        self._inflight: dict[tuple[str, int], asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT, total=CONNECT_TIMEOUT + READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit_per_host=4, ttl_dns_cache=300))
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+
+    async def get(self, url: str, width: int) -> bytes:
+        """The logo at `url` resized to `width`, as PNG bytes.
+
+        Raises:
+            `ValueError`: The logo couldn't be downloaded or isn't a valid image.
+        """
+        key = (url, width)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            logo = await asyncio.to_thread(prepare_logo, await self.download(url), width)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marks it retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+        future.set_result(logo)
+        self._cache[key] = logo
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return logo
+
+    async def download(self, url: str) -> bytes:
+        """Streams an image, aborting as soon as it goes over `max_bytes`.
+
+        Raises:
+            `ValueError`: Not an image, too big or the download failed.
+        """
+        try:
+            async with self._get_session().get(url) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith("image/"):
+                    raise ValueError(f"URL does not point to an image: {content_type}")
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    raise ValueError(f"Image bigger than {self.max_bytes // 1024} KB")
+
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > self.max_bytes:
+                        raise ValueError(f"Image bigger than {self.max_bytes // 1024} KB")
+                return bytes(data)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ValueError(f"Couldn't download the logo: {e}") from e
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -1,25 +1,16 @@
-import qrcode
 import io
 from urllib.parse import quote
 
-from qrcode.constants import ERROR_CORRECT_H
-from PIL import Image
 from typing import Optional
-from utils.qrcode.qr_str import get_logo
+from utils.qrcode.engine import render, DEFAULT_FORMAT
 
 
-def generate_wifi_qr(ssid: str, security: str, password: Optional[str], logo_url: Optional[str] = None) -> io.BytesIO:
+def wifi_payload(ssid: str, security: str, password: Optional[str]) -> str:
     """
-    Generates a WiFi QR code image that can be scanned to connect automatically.
+    Validates the network and returns the `WIFI:` string encoded in the QR.
 
-    Args:
-        `ssid`: Network name (SSID).
-        `security`: Security type (WEP, WPA, WPA2, WPA3, nopass).
-        `password`: Network password.
-        `logo_url`: URL to the logo to insert in the center of the QR.
-
-    Returns:
-        `io.BytesIO`: A BytesIO object containing the generated QR code.
+    Raises:
+        `ValueError`: Invalid network data.
     """
 
     # Validations
@@ -37,30 +28,22 @@ def generate_wifi_qr(ssid: str, security: str, password: Optional[str], logo_url
     else:
         if isinstance(password, str):
             wifi_data = 'WIFI:S:{};T:{};P:{};;'.format(quote(ssid), security, quote(password))
+    return wifi_data
 
 
-    qr = qrcode.QRCode(
-        version=4,
-        error_correction=ERROR_CORRECT_H, # 30% error correction
-        box_size=10,
-        border=2,
-    )
-    qr.add_data(wifi_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert("RGB") # type: ignore
-
-    if logo_url:
-        logo = get_logo(logo_url)
-        wsize = img.size[0] // 4  # 25%
-        wpercent = wsize / float(logo.size[0])
-        hsize = int(float(logo.size[1]) * wpercent) #Maintain aspect ratio
-        logo = logo.resize((wsize, hsize), Image.Resampling.LANCZOS)
+def generate_wifi_qr(ssid: str, security: str, password: Optional[str], logo: Optional[bytes] = None,
+                     format: str = DEFAULT_FORMAT) -> io.BytesIO:
+    """
+    Generates a WiFi QR code image that can be scanned to connect automatically.
 
-        center = ((img.size[0] - logo.size[0]) // 2, (img.size[1] - logo.size[1]) // 2)
-        img.paste(logo, center, mask=logo)
+    Args:
+        `ssid`: Network name (SSID).
+        `security`: Security type (WEP, WPA, WPA2, WPA3, nopass).
+        `password`: Network password.
+        `logo`: PNG of the logo to insert in the center of the QR.
+        `format`: Output format, `png`, `svg` or `webp`.
 
-    # Return image as bytes
-    output = io.BytesIO()
-    img.save(output, format="JPEG")
-    output.seek(0)
-    return output
\ No newline at end of file
+    Returns:
+        `io.BytesIO`: A BytesIO object containing the generated QR code.
+    """
+    return render(wifi_payload(ssid, security, password), logo, format)
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+from qrcode.constants import ERROR_CORRECT_H
+from utils.qrcode.engine import VERSION, BOX_SIZE, BORDER
+
+MEMORY_BUDGET = 32 * 1024 * 1024
+DISK_BUDGET = 256 * 1024 * 1024
+
+
+def cache_key(data: str, logo: Optional[bytes], format: str) -> str:
+    """Hash of everything that changes the rendered image: the data, the logo, the QR options and the output format."""
+    logo_hash = hashlib.sha256(logo).hexdigest() if logo else "-"
+    fields = [data, logo_hash, str(VERSION), str(ERROR_CORRECT_H), str(BOX_SIZE), str(BORDER), format]
+    return hashlib.sha256("\0".join(fields).encode()).hexdigest()
+
+
+class RenderCache:
+    """Rendered QR images by `cache_key`, LRU evicted once they go over `max_bytes`.
+
+    With a `spill_dir`, evicted images are written there (up to `disk_bytes`, oldest deleted first) and read back
+    on a miss. Entries put with `persist=False` (WiFi QRs, they contain the password) never touch the disk.
+    """
+    def __init__(self, max_bytes: int = MEMORY_BUDGET, spill_dir: Optional[str] = None, disk_bytes: int = DISK_BUDGET) -> None:
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.disk_bytes = disk_bytes
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[bytes, bool]] = OrderedDict()
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            files = [entry for entry in os.scandir(spill_dir) if entry.name.endswith(".qr")]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                self._disk[entry.name[:-3]] = entry.stat().st_size
+                self._disk_size += entry.stat().st_size
+
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.qr")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if key in self._memory:
+            self.hits += 1
+            self._memory.move_to_end(key)
+            return self._memory[key][0]
+
+        if key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read, key)
+            except OSError:
+                self._forget(key)
+            else:
+                self.disk_hits += 1
+                self._forget(key)
+                if key not in self._memory:
+                    self._store(key, data, True)
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes, persist: bool = True) -> None:
+        """Caches a rendered image. `persist=False` keeps it in memory only."""
+        if key in self._memory or len(data) > self.max_bytes:
+            return
+        self._store(key, data, persist)
+
+
+    def _store(self, key: str, data: bytes, persist: bool) -> None:
+        self._memory[key] = (data, persist)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            old_key, (old_data, old_persist) = self._memory.popitem(last=False)
+            self.size -= len(old_data)
+            if old_persist and self.spill_dir:
+                self._spill(old_key, old_data)
+
+    def _spill(self, key: str, data: bytes) -> None:
+        # Rendered QRs are a few KB, written inline rather than in a thread so the index never points to a missing file
+        try:
+            self._write(key, data)
+        except OSError:
+            return
+        self._disk_size += len(data) - self._disk.pop(key, 0)
+        self._disk[key] = len(data)
+        while self._disk_size > self.disk_bytes:
+            self._forget(next(iter(self._disk)))
+
+    def _forget(self, key: str) -> None:
+        self._disk_size -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def _write(self, key: str, data: bytes) -> None:
+        tmp = f"{self._path(key)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._memory),
+            "bytes": self.size,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
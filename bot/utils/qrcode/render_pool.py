@@ -0,0 +1,131 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+WORKERS = os.cpu_count() or 1
+MAX_QUEUE = 32
+TIMEOUT = 15
+SAMPLES = 200   # Render times kept for the percentiles
+
+# Imported by the fork server once, so workers start with the QR pipeline already loaded
+PRELOAD = ["qrcode", "PIL.Image", "utils.qrcode.engine", "utils.qrcode.qr_str", "utils.qrcode.qr_wifi"]
+
+
+class RenderQueueFull(Exception):
+    """Too many renders waiting, try again later."""
+
+
+class RenderTimeout(Exception):
+    """A render took longer than the pool's timeout."""
+
+
+def _timed(func: Callable[..., io.BytesIO], *args: Any) -> tuple[bytes, float]:
+    """Runs in the worker: the rendered bytes (cheaper to send back than a BytesIO) and the render time."""
+    start = time.perf_counter()
+    output = func(*args)
+    return output.getvalue(), time.perf_counter() - start
+
+
+class RenderPool:
+    """Runs QR rendering in worker processes so PIL never blocks the event loop.
+
+    At most `workers` renders run at once and `max_queue` wait for a worker, anything beyond that is rejected
+    with `RenderQueueFull`. A render that takes longer than `timeout` raises `RenderTimeout`; its process can't be
+    interrupted, so the pool is replaced and the old one is left to finish in the background.
+    """
+    def __init__(self, logger: logging.Logger, workers: int = WORKERS, max_queue: int = MAX_QUEUE, timeout: float = TIMEOUT) -> None:
+        self.logger = logger
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._times: deque[float] = deque(maxlen=SAMPLES)
+        self._slots = asyncio.Semaphore(workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+
+    def start(self) -> None:
+        if self._executor is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(PRELOAD)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+    async def render(self, func: Callable[..., io.BytesIO], *args: Any) -> io.BytesIO:
+        """Runs `func(*args)` in a worker. `func` and its arguments must be picklable (module-level functions).
+
+        Raises:
+            `RenderQueueFull`: The queue is full.
+            `RenderTimeout`: The render took too long.
+            Whatever `func` raises.
+        """
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull()
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            self.start()
+            future = asyncio.get_running_loop().run_in_executor(self._executor, _timed, func, *args)
+            data, elapsed = await asyncio.wait_for(future, self.timeout)
+
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.logger.error(f" QR render timed out after {self.timeout}s, replacing the worker pool")
+            self.close()
+            raise RenderTimeout()
+
+        except BrokenProcessPool:
+            self.failed += 1
+            self.close()
+            raise
+
+        except Exception:
+            self.failed += 1
+            raise
+
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+        self.completed += 1
+        self._times.append(elapsed)
+        return io.BytesIO(data)
+
+
+    def stats(self) -> dict[str, float]:
+        times = sorted(self._times)
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_ms": sum(times) / len(times) * 1000 if times else 0,
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000 if times else 0,
+        }
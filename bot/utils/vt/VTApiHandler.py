@@ -1,44 +1,222 @@
 import asyncio
 import logging
-from utils.vt.domain_scan import url_report
-from utils.vt.ip_scan import ip_report
-from utils.vt.file_scan import file_report, file_analysis
+import aiohttp
+from typing import Optional
+from utils.vt.verdict_cache import VerdictCache
+from utils.vt.scheduler import VTScheduler, QuotaExceeded, QueuedCallback, INTERACTIVE, BACKGROUND, QUOTA_EXHAUSTED
+from utils.vt.analysis_tracker import AnalysisTracker, UpdateFunc
+from utils.vt.domain_scan import url_report, valid_url, SYNTACTIC, STRATEGIES
+from utils.vt.ip_scan import ip_report, valid_ip
+from utils.vt.file_scan import AnalysisId, analysis_status, file_report, file_analysis, file_stream_analysis, file_sha256, stream_sha256, valid_file, valid_file_size
+
+# Connection pool defaults for the shared session
+CONN_LIMIT = 100
+CONN_LIMIT_PER_HOST = 10
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60    # Per socket read, uploads and downloads set their own total (see file_scan.TRANSFER_TIMEOUT)
 
 class VTApiHandler:
-    def __init__(self, logger: logging.Logger, API_KEY: str) -> None:
+    def __init__(self, logger: logging.Logger, API_KEY: str,
+                 limit: int = CONN_LIMIT,
+                 limit_per_host: int = CONN_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = DNS_CACHE_TTL,
+                 keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 cache: Optional[VerdictCache] = None,
+                 scheduler: Optional[VTScheduler] = None,
+                 tracker: Optional[AnalysisTracker] = None,
+                 url_validation: str = SYNTACTIC) -> None:
         self.logger = logger
         self.API_KEY = API_KEY
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache if cache is not None else VerdictCache()
+        self.scheduler = scheduler if scheduler is not None else VTScheduler()
+        self.tracker = tracker if tracker is not None else AnalysisTracker(logger)
 
         if API_KEY is None:
             raise ValueError("API_KEY is not set. Cannot request to VirusTotal API.")
 
+        if url_validation not in STRATEGIES:
+            raise ValueError(f"Unknown URL validation strategy '{url_validation}'. Use one of: {', '.join(STRATEGIES)}")
+        self.url_validation = url_validation
+
+
+    async def start(self) -> None:
+        """Open the long-lived, connection-pooled session shared by every request."""
+        if self.session is not None and not self.session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+        )
+        self.scheduler.start()
+        self.logger.info(f" VirusTotal session opened (limit={self.limit}, per host={self.limit_per_host})")
+
+    async def close(self) -> None:
+        """Close the shared session, release its pooled connections and write the pending cache entries."""
+        await self.tracker.close()
+        await self.scheduler.close()
+        await self.cache.flush()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            self.logger.info(f" VirusTotal session closed. Verdict cache: {self.cache.stats()}")
+        self.session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session  # type: ignore
+
+    async def _run_once(self, coro_func, *args):
+        """Run a coroutine with a session and scheduler scoped to the current event loop (used by sync wrappers)."""
+        scheduler = self.scheduler
+        self.scheduler = VTScheduler()
+        self.scheduler.bucket = scheduler.bucket
+        await self.start()
+        try:
+            return await coro_func(*args)
+        finally:
+            await self.close()
+            self.scheduler = scheduler
+
+    async def _schedule(self, key: Optional[str], factory, priority: int, on_queued: Optional[QueuedCallback]):
+        try:
+            return await self.scheduler.run(key, factory, priority, on_queued)
+        except QuotaExceeded:
+            self.logger.error(" Daily VirusTotal quota exhausted")
+            return QUOTA_EXHAUSTED
+
 
-    async def ip_result(self, ip: str):
-        result = await ip_report(ip, self.API_KEY)
+    async def ip_result(self, ip: str, priority: int = INTERACTIVE, on_queued: Optional[QueuedCallback] = None):
+        if not await valid_ip(ip):
+            return False
+
+        key = self.cache.ip_key(ip)
+        found, cached = self.cache.get(key)
+        if found:
+            return cached
+
+        session = await self._get_session()
+        result = await self._schedule(key, lambda: ip_report(session, ip, self.API_KEY), priority, on_queued)
+        if result is None or isinstance(result, dict):
+            self.cache.set(key, result)
         return result
 
     def sync_ip_scan(self, ip: str):
-        return asyncio.run(self.ip_result(ip))
+        return asyncio.run(self._run_once(self.ip_result, ip))
+
 
+    async def url_result(self, url: str, priority: int = INTERACTIVE, on_queued: Optional[QueuedCallback] = None):
+        key = self.cache.url_key(url)
+        found, cached = self.cache.get(key)
+        if found:
+            return cached
 
-    async def url_result(self, url: str):
-        result = await url_report(url, self.API_KEY)
+        session = await self._get_session()
+        if not await valid_url(session, url, self.url_validation):
+            return False
+
+        result = await self._schedule(key, lambda: url_report(session, url, self.API_KEY, validate=False), priority, on_queued)
+        if result is None or isinstance(result, dict):
+            self.cache.set(key, result)
         return result
 
     def sync_url_scan(self, url: str):
-        return asyncio.run(self.url_result(url))
+        return asyncio.run(self._run_once(self.url_result, url))
 
 
-    async def file_upload_and_analyze(self, file_data: bytes, filename: str):
-        result = await file_analysis(file_data, filename, self.API_KEY)
-        if isinstance(result, str) and (result.startswith("There was an error") or result.startswith("Upload failed")):
-            return result
+    async def file_upload_and_analyze(self, file_data: bytes, filename: str, priority: int = INTERACTIVE, on_queued: Optional[QueuedCallback] = None):
+        if not await valid_file(file_data):
+            return False
 
-        elif isinstance(result, bool) and not result:
+        file_hash = await asyncio.to_thread(file_sha256, file_data)
+        session = await self._get_session()
+        upload = lambda: file_analysis(session, file_data, filename, self.API_KEY)
+        return await self._file_result(file_hash, filename, upload, priority, on_queued)
+
+    async def file_stream_and_analyze(self, file_url: str, filename: str, file_size: int, priority: int = INTERACTIVE, on_queued: Optional[QueuedCallback] = None):
+        """Same as `file_upload_and_analyze` but streams the file from `file_url` (e.g. a Discord attachment) instead of holding it in memory."""
+        if not valid_file_size(file_size):
+            return False
+
+        session = await self._get_session()
+        file_hash = await stream_sha256(session, file_url)
+        if file_hash is None:
+            return "There was an error downloading the file from Discord."
+
+        upload = lambda: file_stream_analysis(session, file_url, filename, file_hash, self.API_KEY)
+        return await self._file_result(file_hash, filename, upload, priority, on_queued)
+
+    async def _file_result(self, file_hash: str, filename: str, upload, priority: int, on_queued: Optional[QueuedCallback]):
+        """Returns `(stats, file_hash, analysis_id)`, `False` for an invalid file or an error message.
+        For new uploads `stats` is `None` and the analysis can be followed with `track_analysis`."""
+        # Hash first: samples VirusTotal already knows don't need to be uploaded
+        key = self.cache.file_key(file_hash)
+        found, cached = self.cache.get(key)
+        if found and cached is not None:
+            return cached, file_hash, None
+
+        session = await self._get_session()
+        if not found:
+            report = await self._schedule(key, lambda: file_report(session, file_hash, self.API_KEY), priority, on_queued)
+            if isinstance(report, tuple):
+                self.cache.set(key, report[0])
+                return report[0], file_hash, None
+            if isinstance(report, str):
+                return report
+            self.cache.set(key, None)
+
+        result = await self._schedule(None, upload, priority, on_queued)
+        if isinstance(result, AnalysisId):
+            self.logger.info(f" Uploaded {filename} ({file_hash}) for analysis {result}")
+            return None, file_hash, str(result)
+
+        if result is False:
             return False
 
-        else:
-            return await file_report(str(result), self.API_KEY)
+        # Anything but an analysis ID is an error message (network, rate limit, quota...)
+        self.logger.error(f" Upload of {filename} ({file_hash}) failed: {result}")
+        return str(result)
+
+    def track_analysis(self, analysis_id: str, file_hash: str, on_update: UpdateFunc) -> asyncio.Task:
+        """Poll an analysis in the background, awaiting `on_update(status, stats)` as engines report in."""
+        async def poll():
+            session = await self._get_session()
+            return await self._schedule(None, lambda: analysis_status(session, analysis_id, self.API_KEY), BACKGROUND, None)
+
+        def done(stats: dict):
+            self.cache.set(self.cache.file_key(file_hash), stats)
+
+        return self.tracker.track(analysis_id, poll, on_update, done)
+
+    async def _file_upload_and_wait(self, file_data: bytes, filename: str):
+        result = await self.file_upload_and_analyze(file_data, filename)
+        if not isinstance(result, tuple) or result[0] is not None:
+            return result
+
+        _, file_hash, analysis_id = result
+        final = {}
+
+        async def on_update(status: str, stats: dict):
+            if status == "completed":
+                final.update(stats)
+
+        await self.track_analysis(analysis_id, file_hash, on_update)
+        return final or None, file_hash, analysis_id
 
     def sync_file_upload(self, file_data: bytes, filename: str):
-        return asyncio.run(self.file_upload_and_analyze(file_data, filename))
\ No newline at end of file
+        """Blocks until new uploads are analyzed, following them with the tracker. Returns `(stats, file_hash, analysis_id)`,
+        `stats` is `None` if the analysis didn't complete."""
+        return asyncio.run(self._run_once(self._file_upload_and_wait, file_data, filename))
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional, Union
+
+# Polling defaults, in seconds
+INITIAL_DELAY = 15
+MAX_DELAY = 120
+BACKOFF_FACTOR = 2
+TRACK_TIMEOUT = 15 * 60
+MAX_POLLERS = 4
+MAX_ERRORS = 3
+
+PollFunc = Callable[[], Awaitable[Union[tuple[str, dict], str]]]
+UpdateFunc = Callable[[str, dict], Awaitable[Any]]
+
+
+class AnalysisTracker:
+    """Polls pending VirusTotal analyses in background tasks until they complete.
+
+    Polls back off exponentially and at most `max_pollers` analyses are polled at the same time, the rest wait their turn.
+    """
+    def __init__(self, logger: logging.Logger, max_pollers: int = MAX_POLLERS,
+                 initial_delay: float = INITIAL_DELAY, max_delay: float = MAX_DELAY,
+                 timeout: float = TRACK_TIMEOUT) -> None:
+        self.logger = logger
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_pollers)
+        self._tasks: dict[str, asyncio.Task] = {}
+
+
+    def track(self, analysis_id: str, poll: PollFunc, on_update: UpdateFunc,
+              on_done: Optional[Callable[[dict], Any]] = None) -> asyncio.Task:
+        """Start tracking an analysis, returns immediately.
+
+        Args:
+            `analysis_id`: ID returned by the upload, tracking the same ID twice reuses the running task.
+            `poll`: Fetches `(status, stats)` or an error string.
+            `on_update`: Awaited with `(status, stats)` every time they change.
+            `on_done`: Called with the final stats once the analysis is completed.
+        """
+        task = self._tasks.get(analysis_id)
+        if task is not None and not task.done():
+            return task
+
+        task = asyncio.create_task(self._poll(analysis_id, poll, on_update, on_done))
+        self._tasks[analysis_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(analysis_id, None))
+        return task
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def close(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+
+    async def _poll(self, analysis_id: str, poll: PollFunc, on_update: UpdateFunc,
+                    on_done: Optional[Callable[[dict], Any]]) -> None:
+        async with self._semaphore:
+            try:
+                await asyncio.wait_for(self._poll_loop(analysis_id, poll, on_update, on_done), self.timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(f" Gave up polling analysis {analysis_id} after {self.timeout}s")
+                await on_update("timeout", {})
+            except Exception as e:
+                self.logger.error(f" Error while polling analysis {analysis_id}: {e}")
+
+    async def _poll_loop(self, analysis_id: str, poll: PollFunc, on_update: UpdateFunc,
+                         on_done: Optional[Callable[[dict], Any]]) -> None:
+        delay = self.initial_delay
+        errors = 0
+        last = None
+
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * BACKOFF_FACTOR, self.max_delay)
+
+            result = await poll()
+            if isinstance(result, str):
+                errors += 1
+                self.logger.warning(f" Polling analysis {analysis_id} failed ({errors}/{MAX_ERRORS}): {result}")
+                if errors >= MAX_ERRORS:
+                    await on_update("error", {})
+                    return
+                continue
+
+            errors = 0
+            status, stats = result
+            if (status, stats) != last:
+                last = (status, stats)
+                await on_update(status, stats)
+
+            if status == "completed":
+                if on_done is not None:
+                    on_done(stats)
+                return
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from utils.vt.scheduler import BACKGROUND
+from utils.vt.verdict_cache import classify, MALICIOUS
+
+WORKERS = 4
+QUEUE_SIZE = 500
+SEEN_TTL = 3600
+SEEN_MAX_ENTRIES = 10000
+
+# Awaited with (context, type, indicator, stats) for every malicious indicator
+MaliciousFunc = Callable[[Any, str, str, dict], Awaitable[Any]]
+# Decides with (context, stats) whether a report is malicious
+VerdictFunc = Callable[[Any, dict], bool]
+
+
+class AutoScanner:
+    """Checks indicators found in chat messages with a bounded pool of background workers.
+
+    `submit` never blocks: indicators seen recently in the same scope are skipped and, when the queue is full, new
+    ones are dropped so a busy server can't stall the gateway loop. Repeated lookups across scopes are answered
+    by the verdict cache of the handler.
+    """
+    def __init__(self, logger: logging.Logger, handler, on_malicious: MaliciousFunc,
+                 workers: int = WORKERS, queue_size: int = QUEUE_SIZE, seen_ttl: float = SEEN_TTL,
+                 is_malicious: Optional[VerdictFunc] = None) -> None:
+        self.logger = logger
+        self.handler = handler
+        self.on_malicious = on_malicious
+        self.is_malicious = is_malicious or (lambda _, stats: classify(stats) == MALICIOUS)
+        self.workers = workers
+        self.seen_ttl = seen_ttl
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+    def submit(self, context: Any, kind: str, indicator: str, scope: Any = None) -> bool:
+        """Queue an indicator, returns `False` if it was skipped. Indicators are only skipped when they were seen
+        in the same `scope` (the channel alerts go to), so every channel still gets its alert."""
+        key = f"{scope}:{kind}:{indicator}"
+        now = time.monotonic()
+        expires = self._seen.get(key)
+        if expires is not None and expires > now:
+            return False
+
+        try:
+            self._queue.put_nowait((context, kind, indicator))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+        self._seen[key] = now + self.seen_ttl
+        self._seen.move_to_end(key)
+        while len(self._seen) > SEEN_MAX_ENTRIES:
+            self._seen.popitem(last=False)
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped, "workers": len(self._tasks)}
+
+
+    async def _worker(self) -> None:
+        while True:
+            context, kind, indicator = await self._queue.get()
+            try:
+                if kind == "ip":
+                    result = await self.handler.ip_result(indicator, priority=BACKGROUND)
+                else:
+                    result = await self.handler.url_result(indicator, priority=BACKGROUND)
+
+                if isinstance(result, dict) and self.is_malicious(context, result):
+                    await self.on_malicious(context, kind, indicator, result)
+
+            except Exception as e:
+                self.logger.error(f" Auto scan failed for {indicator}: {e}")
+
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,90 @@
+import csv
+import io
+import re
+from hashlib import sha256
+from ipaddress import ip_address
+from urllib.parse import urlsplit
+from utils.vt.verdict_cache import normalize_url, classify, MALICIOUS, CLEAN, NO_REPORT
+
+MAX_INDICATORS = 50
+MAX_FILE_SIZE = 256 * 1024
+
+SEPARATORS = re.compile(r"[\s,;|]+")
+# Common defanging used in incident reports: hxxp://, example[.]com, 1.2.3[.]4
+DEFANGS = [(re.compile(r"^hxxp", re.IGNORECASE), "http"), (re.compile(r"\[\.\]|\(\.\)|\{\.\}"), "."), (re.compile(r"\[:\]"), ":")]
+
+VERDICT_ICONS = {MALICIOUS: "💀", CLEAN: "✔️", NO_REPORT: "🤔", "invalid": "❌", "error": "⚠️"}
+CSV_HEADER = ["indicator", "type", "verdict", "malicious", "suspicious", "harmless", "undetected", "link"]
+
+
+def refang(token: str) -> str:
+    token = token.strip().strip("<>\"'()[]")
+    for pattern, replacement in DEFANGS:
+        token = pattern.sub(replacement, token)
+    return token
+
+
+def parse_indicators(text: str) -> tuple[list[tuple[str, str]], list[str]]:
+    """Extracts IPs and URLs from free text (log pastes, .txt or .csv files).
+
+    Returns:
+        A tuple with the deduplicated `(type, indicator)` pairs, in order of appearance, and the rejected tokens.
+    """
+    indicators = []
+    invalid = []
+    seen = set()
+
+    for raw in SEPARATORS.split(text):
+        token = refang(raw)
+        if not token:
+            continue
+
+        try:
+            ip = ip_address(token)
+            kind, value = "ip", ip.compressed
+            if not ip.is_global:
+                invalid.append(raw)
+                continue
+        except ValueError:
+            parts = urlsplit(token)
+            if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+                invalid.append(raw)
+                continue
+            kind, value = "url", normalize_url(token)
+
+        if (kind, value) not in seen:
+            seen.add((kind, value))
+            indicators.append((kind, value))
+
+    return indicators, invalid
+
+
+def vt_link(kind: str, indicator: str) -> str:
+    if kind == "ip":
+        return f"https://www.virustotal.com/gui/ip-address/{indicator}"
+    return f"https://www.virustotal.com/gui/url/{sha256(indicator.encode()).hexdigest()}"
+
+
+def verdict_of(result, malicious: int = 0, suspicious: int = 2) -> str:
+    """Verdict label for a result returned by `VTApiHandler.ip_result`/`url_result`."""
+    if result is None or isinstance(result, dict):
+        return classify(result, malicious, suspicious)
+    if result is False:
+        return "invalid"
+    return "error"
+
+
+def results_to_csv(rows: list[tuple[str, str, object]], malicious: int = 0, suspicious: int = 2) -> io.BytesIO:
+    """Builds the CSV attachment from `(type, indicator, result)` rows."""
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(CSV_HEADER)
+    for kind, indicator, result in rows:
+        stats = result if isinstance(result, dict) else {}
+        writer.writerow([
+            indicator, kind, verdict_of(result, malicious, suspicious),
+            stats.get("malicious", ""), stats.get("suspicious", ""),
+            stats.get("harmless", ""), stats.get("undetected", ""),
+            vt_link(kind, indicator),
+        ])
+    return io.BytesIO(text.getvalue().encode())
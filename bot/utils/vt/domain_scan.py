@@ -1,34 +1,90 @@
 import aiohttp
+import time
 import base64 as b64
+from collections import OrderedDict
 from urllib.parse import urlparse
 from typing import Union
+from utils.vt.scheduler import RATE_LIMITED
+from utils.vt.verdict_cache import normalize_url
 
-async def valid_url(url: str) -> bool:
-    """Check if the URL is valid and exists."""
+# URL validation strategies
+SYNTACTIC = "syntactic"  # Only check the URL format, no network access
+CACHED = "cached"        # Probe reachability once per URL, remembering the answer for a short time
+PROBE = "probe"          # Probe reachability on every request
+STRATEGIES = (SYNTACTIC, CACHED, PROBE)
+
+PROBE_TIMEOUT = 5
+REACHABILITY_TTL = 300
+REACHABILITY_MAX_ENTRIES = 1024
+
+_reachability: OrderedDict[str, tuple[float, bool]] = OrderedDict()
+
+
+def valid_url_syntax(url: str) -> bool:
+    """Check if the URL is a well-formed http(s) URL."""
     try:
         parsed = urlparse(url)
-        if not all([parsed.scheme, parsed.netloc]):
-            return False
+        return parsed.scheme.lower() in ("http", "https") and bool(parsed.hostname)
+    except ValueError:
+        return False
 
-        headers = {"cache-control": "no-cache"}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.head(url, allow_redirects=True, headers=headers) as response:
-                check1 = 200 <= response.status < 400
-            async with session.get(url, allow_redirects=True, headers=headers) as response:
-                check2 = 200 <= response.status < 400
-        return check1 or check2
+async def probe_url(session: aiohttp.ClientSession, url: str, timeout: float = PROBE_TIMEOUT) -> bool:
+    """Check if the URL answers, without downloading its body.
 
-    except aiohttp.ClientError as e:
+    Any answer but 404/410 counts, so a WAF rejecting the bot doesn't make the URL invalid.
+    """
+    headers = {"cache-control": "no-cache"}
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    try:
+        async with session.head(url, allow_redirects=True, headers=headers, timeout=client_timeout) as response:
+            status = response.status
+
+        if status in (405, 501):
+            # HEAD not supported, only the status line and headers of the GET are read
+            async with session.get(url, allow_redirects=True, headers=headers, timeout=client_timeout) as response:
+                status = response.status
+                response.close()
+
+        return status not in (404, 410)
+
+    except (aiohttp.ClientError, TimeoutError):
         return False
 
     except Exception as e:
         return False
 
 
-async def url_report(url: str, api_key: str) -> Union[bool, dict, str]:
-    """Request a report of a URL from VirusTotal API."""
-    if not await valid_url(url):
+async def valid_url(session: aiohttp.ClientSession, url: str, strategy: str = SYNTACTIC) -> bool:
+    """Check if the URL is valid and, depending on `strategy`, that it exists."""
+    if not valid_url_syntax(url):
+        return False
+
+    if strategy == PROBE:
+        return await probe_url(session, url)
+
+    if strategy == CACHED:
+        # Per URL and not per host, a 404 on one path says nothing about the rest of the site
+        key = normalize_url(url)
+        entry = _reachability.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _reachability.move_to_end(key)
+            return entry[1]
+
+        reachable = await probe_url(session, url)
+        _reachability[key] = (time.monotonic() + REACHABILITY_TTL, reachable)
+        _reachability.move_to_end(key)
+        while len(_reachability) > REACHABILITY_MAX_ENTRIES:
+            _reachability.popitem(last=False)
+        return reachable
+
+    return True
+
+
+async def url_report(session: aiohttp.ClientSession, url: str, api_key: str, validate: bool = True, strategy: str = SYNTACTIC) -> Union[bool, dict, str, None]:
+    """Request a report of a URL from VirusTotal API. Returns `None` if VirusTotal has no report."""
+    if validate and not await valid_url(session, url, strategy):
         return False
 
     headers = {
@@ -43,18 +99,21 @@ async def url_report(url: str, api_key: str) -> Union[bool, dict, str]:
     request_url = f"https://www.virustotal.com/api/v3/urls/{url_encoded}"
 
     try:
-        async with aiohttp.ClientSession() as session:  
-            async with session.get(request_url, headers=headers) as response:
-                if response.raise_for_status():
-                    return "There was an error while making the request. Check if you exceeded API rate limit"
-                data = await response.json()
-
-                if "data" in data:
-                    return data["data"]["attributes"]["last_analysis_stats"]
-
-                else:
-                    error_text = await response.text()
-                    return f"Request failed with status {response.status}: {error_text}"
+        async with session.get(request_url, headers=headers) as response:
+            if response.status == 404:
+                return None
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error while making the request. Check if you exceeded API rate limit"
+            data = await response.json()
+
+            if "data" in data:
+                return data["data"]["attributes"]["last_analysis_stats"]
+
+            else:
+                error_text = await response.text()
+                return f"Request failed with status {response.status}: {error_text}"
 
     except aiohttp.ClientError as e:
         return f"Error in the request: {e}"
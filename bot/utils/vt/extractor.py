@@ -0,0 +1,46 @@
+import re
+from ipaddress import ip_address
+from utils.vt.verdict_cache import normalize_url
+
+MAX_PER_MESSAGE = 5
+
+# Compiled once, they run on every message the bot sees
+URL_PATTERN = re.compile(r"https?://[^\s<>\"'`|]+", re.IGNORECASE)
+IPV4_PATTERN = re.compile(r"(?<![\d.])(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(?![\d.])")
+TRAILING = ".,;:!?)]}>*_~"
+
+
+def extract_indicators(text: str, limit: int = MAX_PER_MESSAGE) -> list[tuple[str, str]]:
+    """Finds URLs and public IPv4 addresses in a message.
+
+    Returns:
+        Up to `limit` deduplicated `(type, indicator)` pairs, URLs first.
+    """
+    found: list[tuple[str, str]] = []
+
+    # Cheap pre-checks, most messages contain neither
+    if "://" in text:
+        for match in URL_PATTERN.finditer(text):
+            url = match.group().rstrip(TRAILING)
+            try:
+                item = ("url", normalize_url(url))
+            except ValueError:
+                continue
+            if item not in found:
+                found.append(item)
+            if len(found) >= limit:
+                return found
+
+    if "." in text:
+        for match in IPV4_PATTERN.finditer(text):
+            try:
+                ip = ip_address(match.group())
+            except ValueError:
+                continue
+            item = ("ip", ip.compressed)
+            if ip.is_global and item not in found:
+                found.append(item)
+            if len(found) >= limit:
+                return found
+
+    return found
@@ -1,23 +1,79 @@
 import aiohttp
+import asyncio
+import hashlib
+import logging
 from io import BytesIO
-from typing import Union
-from base64 import b64decode
+from typing import AsyncIterator, Optional, Union
+from utils.vt.scheduler import RATE_LIMITED
+
+logger = logging.getLogger("VT")
+
+HASH_CHUNK_SIZE = 1024**2
+STREAM_CHUNK_SIZE = 64 * 1024  # Memory used per streamed upload is bounded by this buffer
+TRANSFER_TIMEOUT = 300         # Total seconds for a file upload or download
+
+
+class AnalysisId(str):
+    """ID of the analysis started by a successful upload. Any other string an upload returns is an error message."""
+
+
+def file_sha256(file_data: bytes, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Computes the SHA-256 of the file in chunks (run it in a thread, it is CPU bound)."""
+    digest = hashlib.sha256()
+    view = memoryview(file_data)
+    for i in range(0, len(view), chunk_size):
+        digest.update(view[i:i + chunk_size])
+    return digest.hexdigest()
+
+
+def valid_file_size(file_size: int, mb: int = 32) -> bool:
+    """Checks that a file of the given size don't surpass API's size limit and is not empty."""
+    return 0 < file_size <= mb * 1024**2
 
 
 async def valid_file(file: bytes, mb: int = 32) -> bool:
     """Checks that the file don't surpass API's size limit and is not empty."""
-    max_size = mb * 1024**2
     try:
-        file_size = len(file)
-        if file_size > max_size or file_size <= 0:
-            return False
-        return True
+        return valid_file_size(len(file), mb)
     except Exception as e:
         return False
 
 
+def transfer_timeout(session: aiohttp.ClientSession) -> aiohttp.ClientTimeout:
+    """The session timeout with a `TRANSFER_TIMEOUT` total. A per-request timeout replaces the session one as a whole,
+    so the connect and read limits are carried over."""
+    return aiohttp.ClientTimeout(
+        total=TRANSFER_TIMEOUT,
+        connect=session.timeout.connect,
+        sock_connect=session.timeout.sock_connect,
+        sock_read=session.timeout.sock_read,
+    )
+
+
+async def _iter_download(session: aiohttp.ClientSession, file_url: str, digest=None) -> AsyncIterator[bytes]:
+    """Yields the file at `file_url` in small chunks, feeding `digest` (a hashlib object) along the way."""
+    async with session.get(file_url, timeout=transfer_timeout(session)) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if digest is not None:
+                digest.update(chunk)
+            yield chunk
+
+
+async def stream_sha256(session: aiohttp.ClientSession, file_url: str) -> Optional[str]:
+    """Computes the SHA-256 of a remote file (e.g. a Discord attachment) without keeping it in memory."""
+    digest = hashlib.sha256()
+    try:
+        async for _ in _iter_download(session, file_url, digest):
+            pass
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f" Couldn't download {file_url}: {e!r}")
+        return None
+    return digest.hexdigest()
+
+
 
-async def file_analysis(file_data: bytes, filename: str, api_key: str) -> Union[bool, str]:
+async def file_analysis(session: aiohttp.ClientSession, file_data: bytes, filename: str, api_key: str) -> Union[bool, AnalysisId, str]:
     """Upload file to VirusTotal for analysis."""
     is_valid = await valid_file(file_data)
     if not is_valid:
@@ -43,18 +99,19 @@ async def file_analysis(file_data: bytes, filename: str, api_key: str) -> Union[
         
         request = "https://www.virustotal.com/api/v3/files"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(request, headers=headers, data=data) as response:
-                if response.raise_for_status():
-                    return "There was an error uploading the file. Check if you exceeded API rate limit"
+        async with session.post(request, headers=headers, data=data, timeout=transfer_timeout(session)) as response:
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error uploading the file. Check if you exceeded API rate limit"
 
-                result = await response.json()
-                if "data" in result and "id" in result["data"]:
-                    return result["data"]["id"]
+            result = await response.json()
+            if "data" in result and "id" in result["data"]:
+                return AnalysisId(result["data"]["id"])
 
-                else:
-                    error_text = await response.text()
-                    return f"Upload failed with status {response.status}: {error_text}"
+            else:
+                error_text = await response.text()
+                return f"Upload failed with status {response.status}: {error_text}"
 
     except aiohttp.ClientError as e:
         return f"Network error while uploading file: {str(e)}"
@@ -65,34 +122,107 @@ async def file_analysis(file_data: bytes, filename: str, api_key: str) -> Union[
 
 
 
-async def file_report(file_id: str, api_key: str):
-    """Request a report of a file from VirusTotal API."""
-    decoded = b64decode(file_id)
-    
-    if b":" in decoded: 
-        decoded = decoded.split(b":")[0].decode()
-    else:
-        decoded = decoded.decode()
+async def file_stream_analysis(session: aiohttp.ClientSession, file_url: str, filename: str, file_hash: str, api_key: str) -> Union[AnalysisId, str]:
+    """Upload a remote file to VirusTotal for analysis, piping the download straight into the multipart body.
+
+    The file is hashed on the fly and compared with `file_hash` to detect a file that changed between downloads.
+    """
+    headers = {
+        "x-apikey": str(api_key),
+        "Accept": "application/json",
+    }
+    digest = hashlib.sha256()
+
+    try:
+        data = aiohttp.FormData()
+        data.add_field(
+            'file',
+            _iter_download(session, file_url, digest),
+            filename=filename,
+            content_type='application/octet-stream'
+        )
+
+        request = "https://www.virustotal.com/api/v3/files"
+
+        async with session.post(request, headers=headers, data=data, timeout=transfer_timeout(session)) as response:
+            if digest.hexdigest() != file_hash:
+                logger.warning(f" {filename} changed while uploading, expected {file_hash}")
+
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error uploading the file. Check if you exceeded API rate limit"
+
+            result = await response.json()
+            if "data" in result and "id" in result["data"]:
+                return AnalysisId(result["data"]["id"])
+
+            else:
+                error_text = await response.text()
+                return f"Upload failed with status {response.status}: {error_text}"
+
+    except aiohttp.ClientError as e:
+        return f"Network error while uploading file: {str(e)}"
+    except Exception as e:
+        return f"Unexpected error while uploading file: {str(e)}"
+
+
+
+async def file_report(session: aiohttp.ClientSession, file_hash: str, api_key: str) -> Union[tuple[dict, str], str, None]:
+    """Request a report of a file (by MD5, SHA-1 or SHA-256) from VirusTotal API. Returns `None` if VirusTotal has no report."""
+    headers = {
+        "x-apikey": str(api_key),
+        "Accept": "application/json",
+    }
+    request = f"https://www.virustotal.com/api/v3/files/{file_hash}"
+
+    try:
+        async with session.get(request, headers=headers) as response:
+            if response.status == 404:
+                return None
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error while making the request. Check if you exceeded API rate limit"
+            data = await response.json()
+
+            if "data" in data:
+                return data["data"]["attributes"]["last_analysis_stats"], file_hash
+
+            else:
+                error_text = await response.text()
+                return f"Request failed with status {response.status}: {error_text}"
+
+    except aiohttp.ClientError as e:
+        return f"Error in the request: {e}"
+    except Exception as e:
+        return f"Unexpected error: {e}"
+
+
 
+async def analysis_status(session: aiohttp.ClientSession, analysis_id: str, api_key: str) -> Union[tuple[str, dict], str]:
+    """Request the state of an analysis from VirusTotal API. Returns its status (`queued`, `in-progress`, `completed`) and engine stats."""
     headers = {
         "x-apikey": str(api_key),
         "Accept": "application/json",
     }
-    request = f"https://www.virustotal.com/api/v3/files/{decoded}"
+    request = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
 
     try:
-        async with aiohttp.ClientSession() as session:  
-            async with session.get(request, headers=headers) as response:
-                if response.raise_for_status():
-                    return "There was an error while making the request. Check if you exceeded API rate limit"
-                data = await response.json()
-
-                if "data" in data:
-                    return data["data"]["attributes"]["last_analysis_stats"], decoded
-
-                else:
-                    error_text = await response.text()
-                    return f"Request failed with status {response.status}: {error_text}"
+        async with session.get(request, headers=headers) as response:
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error while making the request. Check if you exceeded API rate limit"
+            data = await response.json()
+
+            if "data" in data:
+                attributes = data["data"]["attributes"]
+                return attributes["status"], attributes["stats"]
+
+            else:
+                error_text = await response.text()
+                return f"Request failed with status {response.status}: {error_text}"
 
     except aiohttp.ClientError as e:
         return f"Error in the request: {e}"
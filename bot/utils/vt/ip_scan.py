@@ -1,6 +1,7 @@
 import aiohttp
 from ipaddress import ip_address
 from typing import Union
+from utils.vt.scheduler import RATE_LIMITED
 
 async def valid_ip(ip: str) -> bool:
     """Check if the IP address is valid and public."""
@@ -10,8 +11,8 @@ async def valid_ip(ip: str) -> bool:
     except ValueError:
         return False
 
-async def ip_report(ip: str, api_key: str) -> Union[bool, dict, str]: 
-    """Request a report of an IP address from VirusTotal API."""
+async def ip_report(session: aiohttp.ClientSession, ip: str, api_key: str) -> Union[bool, dict, str, None]:
+    """Request a report of an IP address from VirusTotal API. Returns `None` if VirusTotal has no report."""
     if not await valid_ip(ip):
         return False
     
@@ -24,18 +25,21 @@ async def ip_report(ip: str, api_key: str) -> Union[bool, dict, str]:
     url = f"https://www.virustotal.com/api/v3/ip_addresses/{ip}"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.raise_for_status():
-                    return "There was an error while making the request. Check if you exceeded API rate limit"
-                data = await response.json()
-                
-                if "data" in data:
-                    return data["data"]["attributes"]["last_analysis_stats"]
-                
-                else:
-                    error_text = await response.text()
-                    return f"Request failed with status {response.status}: {error_text}"
+        async with session.get(url, headers=headers) as response:
+            if response.status == 404:
+                return None
+            if response.status == 429:
+                return RATE_LIMITED
+            if response.raise_for_status():
+                return "There was an error while making the request. Check if you exceeded API rate limit"
+            data = await response.json()
+
+            if "data" in data:
+                return data["data"]["attributes"]["last_analysis_stats"]
+
+            else:
+                error_text = await response.text()
+                return f"Request failed with status {response.status}: {error_text}"
 
     except aiohttp.ClientError as e:
         return f"Error in the request: {e}"
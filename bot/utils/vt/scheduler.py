@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+# Request priorities, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Public API tier limits
+PUBLIC_PER_MINUTE = 4
+PUBLIC_PER_DAY = 500
+
+QueuedCallback = Callable[[int, float], Awaitable[Any]]
+
+# Messages returned to the commands when VirusTotal quota is the problem
+RATE_LIMITED = "There was an error: VirusTotal API rate limit exceeded. Try again in a minute."
+QUOTA_EXHAUSTED = "There was an error: the daily VirusTotal API quota is used up. Try again tomorrow."
+
+
+class QuotaExceeded(Exception):
+    """Raised when the daily request quota has been used up."""
+
+
+class TokenBucket:
+    """Token bucket refilled at `per_minute` tokens per minute, with a daily cap reset at 00:00 UTC."""
+    def __init__(self, per_minute: int = PUBLIC_PER_MINUTE, per_day: Optional[int] = PUBLIC_PER_DAY) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.per_day = per_day
+        self.tokens = self.capacity
+        self.used_today = 0
+        self._day = self._today()
+        self._last = time.monotonic()
+
+    @staticmethod
+    def _today() -> int:
+        return int(time.time() // 86400)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used_today = 0
+
+    def exhausted(self) -> bool:
+        self._refill()
+        return self.per_day is not None and self.used_today >= self.per_day
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+        self.used_today += 1
+
+
+class VTScheduler:
+    """Queues VirusTotal calls behind a token bucket.
+
+    Calls sharing a `key` while one is in flight are coalesced into a single request.
+    Interactive calls always leave the queue before background ones.
+    """
+    def __init__(self, per_minute: int = PUBLIC_PER_MINUTE, per_day: Optional[int] = PUBLIC_PER_DAY) -> None:
+        self.bucket = TokenBucket(per_minute, per_day)
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._waiting: dict[int, int] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._running: set[asyncio.Task] = set()
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+
+    def start(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        for task in list(self._running):
+            task.cancel()
+
+        # Fail whatever is still queued so no caller waits forever
+        while not self._queue.empty():
+            *_, future = self._queue.get_nowait()
+            future.cancel()
+        self._waiting.clear()
+
+
+    def position(self, priority: int, seq: Optional[int] = None) -> int:
+        """Number of queued calls that will run before a call with the given priority."""
+        return sum(1 for s, p in self._waiting.items() if p <= priority and (seq is None or s < seq))
+
+    def eta(self, position: int) -> float:
+        """Estimated seconds before the call at `position` gets a token."""
+        return self.bucket.wait_time() + position / self.bucket.rate
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": len(self._waiting),
+            "in_flight": len(self._inflight),
+            "used_today": self.bucket.used_today,
+            "per_day": self.bucket.per_day,
+        }
+
+
+    async def run(self, key: Optional[str], factory: Callable[[], Awaitable[Any]],
+                  priority: int = INTERACTIVE, on_queued: Optional[QueuedCallback] = None) -> Any:
+        """Run `factory()` once quota allows it and return its result.
+
+        Args:
+            `key`: Identifies the lookup for coalescing (`None` disables it).
+            `factory`: Creates the coroutine performing the actual request.
+            `priority`: `INTERACTIVE` or `BACKGROUND`.
+            `on_queued`: Awaited with `(position, eta_seconds)` if the call has to wait.
+
+        Raises:
+            `QuotaExceeded`: The daily quota is used up.
+        """
+        if key is not None and key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        if self.bucket.exhausted():
+            raise QuotaExceeded(f"Daily quota of {self.bucket.per_day} requests reached")
+
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        seq = next(self._seq)
+        position = self.position(priority, seq)
+        self._waiting[seq] = priority
+        self._queue.put_nowait((priority, seq, factory, future))
+
+        eta = self.eta(position)
+        if on_queued is not None and eta >= 1:
+            await on_queued(position + 1, eta)
+
+        return await asyncio.shield(future)
+
+
+    async def _dispatch(self) -> None:
+        while True:
+            item = await self._queue.get()
+            wait = self.bucket.wait_time()
+            if wait > 0:
+                # Requeue so a higher priority call arriving meanwhile can overtake this one
+                self._queue.put_nowait(item)
+                await asyncio.sleep(wait)
+                continue
+
+            priority, seq, factory, future = item
+            self._waiting.pop(seq, None)
+            if future.done():
+                continue
+
+            if self.bucket.exhausted():
+                future.set_exception(QuotaExceeded(f"Daily quota of {self.bucket.per_day} requests reached"))
+                continue
+
+            self.bucket.take()
+            task = asyncio.create_task(self._execute(factory, future))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _execute(factory: Callable[[], Awaitable[Any]], future: asyncio.Future) -> None:
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
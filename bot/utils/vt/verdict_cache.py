@@ -0,0 +1,199 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from ipaddress import ip_address
+from typing import Any, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Verdict classes and their default time to live (seconds)
+MALICIOUS = "malicious"
+CLEAN = "clean"
+NO_REPORT = "no_report"
+
+DEFAULT_TTLS = {
+    MALICIOUS: 24 * 3600,
+    CLEAN: 3600,
+    NO_REPORT: 600,
+}
+DEFAULT_MAX_ENTRIES = 2048
+FLUSH_DELAY = 1  # Seconds writes are gathered before they go to SQLite in a single transaction
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings share a cache entry.
+
+    Scheme and host are lowercased, default ports and fragments are dropped and an empty path becomes `/`.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        host = f"{userinfo}@{host}"
+
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def classify(stats: Optional[dict], malicious: int = 0, suspicious: int = 2) -> str:
+    """Map a `last_analysis_stats` dict (or `None` when there is no report) to a verdict class."""
+    if stats is None:
+        return NO_REPORT
+    if stats.get("malicious", 0) > malicious or stats.get("suspicious", 0) > suspicious:
+        return MALICIOUS
+    return CLEAN
+
+
+class VerdictCache:
+    """Bounded LRU cache of VirusTotal verdicts with a TTL per verdict class.
+
+    Keys look like `url:<normalized url>`, `ip:<address>` or `file:<sha256>`.
+    When `db_path` is given, entries are saved to a SQLite file and reloaded on start. Writes are batched and run in
+    a thread every `FLUSH_DELAY` seconds, so a burst of scans doesn't block the event loop on disk commits.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttls: Optional[dict[str, int]] = None, db_path: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        # Rows waiting to be written by key, `None` to delete it
+        self._pending: dict[str, Optional[tuple[float, str]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._db_lock = threading.Lock()
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            self._db.commit()
+            self._load()
+
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return f"url:{normalize_url(url)}"
+
+    @staticmethod
+    def ip_key(ip: str) -> str:
+        try:
+            return f"ip:{ip_address(ip.strip()).compressed}"
+        except ValueError:
+            return f"ip:{ip.strip()}"
+
+    @staticmethod
+    def file_key(sha256: str) -> str:
+        return f"file:{sha256.lower()}"
+
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """Return `(found, value)`. `value` may legitimately be `None` for a cached "no report"."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires, value = entry
+        if expires < time.time():
+            self._delete(key)
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: Optional[dict]) -> None:
+        """Store a `last_analysis_stats` dict (or `None` for "no report") with the TTL of its verdict class."""
+        expires = time.time() + self.ttls[classify(value)]
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._queue_write(old_key, None)
+
+        self._queue_write(key, (expires, json.dumps(value)))
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    async def flush(self) -> None:
+        """Writes what is pending now instead of waiting for the next batch."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await asyncio.to_thread(self._write, self._take_pending())
+
+    def close(self) -> None:
+        """Writes what is pending and closes the database."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        self._write(self._take_pending())
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+    def _delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._queue_write(key, None)
+
+    def _queue_write(self, key: str, row: Optional[tuple[float, str]]) -> None:
+        if self._db is None:
+            return
+        self._pending[key] = row
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to block, write right away
+            self._write(self._take_pending())
+            return
+        if self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_later())
+
+    def _take_pending(self) -> dict[str, Optional[tuple[float, str]]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(FLUSH_DELAY)
+            await asyncio.to_thread(self._write, self._take_pending())
+        finally:
+            self._flush_task = None
+        if self._pending:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def _write(self, pending: dict[str, Optional[tuple[float, str]]]) -> None:
+        """Applies pending rows in one transaction, runs in a thread."""
+        if not pending:
+            return
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany("DELETE FROM verdicts WHERE key = ?", [(key,) for key, row in pending.items() if row is None])
+            self._db.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)",
+                                 [(key, *row) for key, row in pending.items() if row is not None])
+            self._db.commit()
+
+    def _load(self) -> None:
+        assert self._db is not None
+        now = time.time()
+        self._db.execute("DELETE FROM verdicts WHERE expires < ?", (now,))
+        rows = self._db.execute("SELECT key, expires, value FROM verdicts ORDER BY expires DESC LIMIT ?", (self.max_entries,))
+        for key, expires, value in reversed(rows.fetchall()):
+            self._entries[key] = (expires, json.loads(value))
+        self._db.commit()